@@ -0,0 +1,127 @@
+import asyncio
+
+
+class GuildStateActor:
+    """Single writer for score state: one queue and worker task per guild
+
+    Everything queued for a guild is applied in submission order by its worker,
+    runs of reward changes are merged into one storage write, and on_change is
+    published once per drained batch. Different guilds never wait on each other.
+    """
+
+    REWARD_KINDS = {'rp', 'crown', 'brkt_add', 'brkt_rmv'}
+
+    def __init__(self, storage, on_change=None):
+        self.storage = storage
+        self.on_change = on_change  # Called with guild_id after each applied batch
+        self.submitted = 0
+        self.batches = 0
+        self.writes = 0
+        self._queues = {}
+        self._workers = {}
+
+    def submit(self, guild_id, changes):
+        """Queue (user_id, kind, value) reward changes, returns a future resolved once applied"""
+        changes = list(changes)
+        for _, kind, _ in changes:
+            if kind not in self.REWARD_KINDS:
+                raise ValueError(f"Unknown reward change {kind}")
+        return self._enqueue(guild_id, ('rewards', changes))
+
+    def run(self, guild_id, func, *args):
+        """Queue any other mutation, returns a future with its result"""
+        return self._enqueue(guild_id, ('call', (func, args)))
+
+    def pending(self, guild_id=None):
+        if guild_id is not None:
+            queue = self._queues.get(guild_id)
+            return queue.qsize() if queue else 0
+        return sum(queue.qsize() for queue in self._queues.values())
+
+    async def drain(self):
+        """Wait until every queued change has been applied"""
+        while True:
+            workers = [worker for worker in self._workers.values() if not worker.done()]
+            if not workers:
+                return
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    def _enqueue(self, guild_id, item):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        queue = self._queues.get(guild_id)
+        if queue is None:
+            queue = self._queues[guild_id] = asyncio.Queue()
+        queue.put_nowait((item, future))
+        self.submitted += 1
+
+        worker = self._workers.get(guild_id)
+        if worker is None or worker.done():
+            self._workers[guild_id] = loop.create_task(self._worker(guild_id))
+        return future
+
+    async def _worker(self, guild_id):
+        queue = self._queues[guild_id]
+        while True:
+            batch = [await queue.get()]
+            while not queue.empty():
+                batch.append(queue.get_nowait())
+            self._apply(guild_id, batch)
+            # Exit when idle, the next submit starts a fresh worker
+            if queue.empty():
+                return
+
+    def _apply(self, guild_id, batch):
+        changes = []
+        waiting = []
+
+        def write_changes():
+            if not changes:
+                return
+            try:
+                self.storage.apply_rewards(guild_id, changes)
+                self.writes += 1
+            except Exception as e:
+                for future in waiting:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                for future in waiting:
+                    if not future.done():
+                        future.set_result(None)
+            changes.clear()
+            waiting.clear()
+
+        for (kind, payload), future in batch:
+            if kind == 'rewards':
+                changes.extend(payload)
+                waiting.append(future)
+                continue
+
+            # Keep ordering: earlier reward changes land before this call
+            write_changes()
+            func, args = payload
+            try:
+                result = func(*args)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(result)
+        write_changes()
+
+        self.batches += 1
+        if self.on_change:
+            try:
+                self.on_change(guild_id)
+            except Exception as e:
+                print(f"⚠️ Error publishing state change for {guild_id}: {e}")
+
+    def stats(self):
+        return {
+            'submitted': self.submitted,
+            'batches': self.batches,
+            'writes': self.writes,
+            'pending': self.pending()
+        }
@@ -0,0 +1,521 @@
+"""Offline benchmarks of the bot's hot paths against fake Discord objects
+
+Runs the real command, button and background-task code from main.py with a
+local stand-in for guilds, members, channels and interactions, so no token or
+live server is needed. Every workload reports ops/sec, p50/p99 latency per
+operation and the peak memory allocated while it ran.
+
+    python benchmark.py                       # all workloads
+    python benchmark.py rewards leaderboard   # just these
+    python benchmark.py --save baseline.json
+    python benchmark.py --baseline baseline.json --tolerance 0.2
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import discord
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+main = None  # The bot module, imported by main_cli() once the scratch directory is set up
+
+HOST_ROLE_ID = 1
+API_LATENCY = 0.0  # Simulated seconds per fake REST call, set by --latency
+_next_id = [10 ** 17]
+
+
+def next_id():
+    _next_id[0] += 1
+    return _next_id[0]
+
+
+async def api_call():
+    if API_LATENCY:
+        await asyncio.sleep(API_LATENCY)
+
+
+class FakeHTTPResponse:
+    status = 404
+    reason = "Not Found"
+
+
+class FakeRole:
+
+    def __init__(self, role_id):
+        self.id = role_id
+
+
+class FakeMember:
+
+    def __init__(self, guild, user_id, name, roles=()):
+        self.guild = guild
+        self.id = user_id
+        self.name = name
+        self.display_name = name
+        self.nick = None
+        self.bot = False
+        self.roles = list(roles)
+        self.mention = f"<@{user_id}>"
+
+    def __str__(self):
+        return self.name
+
+
+class FakeGuild:
+
+    def __init__(self, guild_id, member_count=0):
+        self.id = guild_id
+        self.name = f"Guild {guild_id}"
+        self._members = {}
+        for i in range(member_count):
+            self.add_member(f"player{i}")
+
+    @property
+    def members(self):
+        return list(self._members.values())
+
+    def add_member(self, name, roles=()):
+        member = FakeMember(self, next_id(), name, roles)
+        self._members[member.id] = member
+        return member
+
+    def get_member(self, user_id):
+        return self._members.get(user_id)
+
+    async def query_members(self, user_ids=None, cache=True):
+        await api_call()
+        return [self._members[user_id] for user_id in user_ids or [] if user_id in self._members]
+
+
+class FakeMessage:
+
+    def __init__(self, channel, message_id, content=None, embed=None, deleted=False):
+        self.channel = channel
+        self.id = message_id
+        self.author = main.bot.user
+        self.content = content
+        self.embeds = [embed] if embed else []
+        self.deleted = deleted
+
+    async def edit(self, content=None, embed=None, **kwargs):
+        await api_call()
+        if self.deleted:
+            raise discord.NotFound(FakeHTTPResponse(), "Unknown Message")
+        self.channel.edits += 1
+        if embed is not None:
+            self.embeds = [embed]
+        return self
+
+    async def delete(self, **kwargs):
+        await api_call()
+        if self.deleted:
+            raise discord.NotFound(FakeHTTPResponse(), "Unknown Message")
+        self.deleted = True
+        self.channel.messages.pop(self.id, None)
+
+
+class FakeChannel(discord.TextChannel):
+    """Text channel keeping sent messages in memory (subclassed so isinstance checks pass)"""
+
+    def __init__(self, guild, name="bench"):
+        self.guild = guild
+        self.id = next_id()
+        self.name = name
+        self.messages = {}  # message ID -> message, oldest first
+        self.sends = 0
+        self.edits = 0
+
+    def __repr__(self):
+        return f"<FakeChannel id={self.id} name={self.name!r}>"
+
+    async def send(self, content=None, embed=None, view=None, **kwargs):
+        await api_call()
+        self.sends += 1
+        message = FakeMessage(self, next_id(), content, embed)
+        self.messages[message.id] = message
+        return message
+
+    def get_partial_message(self, message_id):
+        return self.messages.get(message_id) or FakeMessage(self, message_id, deleted=True)
+
+    async def fetch_message(self, message_id):
+        await api_call()
+        message = self.messages.get(message_id)
+        if message is None:
+            raise discord.NotFound(FakeHTTPResponse(), "Unknown Message")
+        return message
+
+    async def history(self, limit=100, **kwargs):
+        await api_call()
+        for message in list(reversed(self.messages.values()))[:limit]:
+            yield message
+
+
+class FakeResponse:
+
+    def __init__(self):
+        self.done = False
+        self.sent = []
+
+    def is_done(self):
+        return self.done
+
+    async def send_message(self, content=None, **kwargs):
+        await api_call()
+        self.done = True
+        self.sent.append(content)
+
+    async def defer(self, **kwargs):
+        self.done = True
+
+
+class FakeInteraction:
+
+    def __init__(self, guild, user, channel):
+        self.guild = guild
+        self.user = user
+        self.channel = channel
+        self.response = FakeResponse()
+        self.followup = channel
+
+
+class FakeContext:
+
+    def __init__(self, guild, author, channel):
+        self.guild = guild
+        self.author = author
+        self.channel = channel
+        self.message = FakeMessage(channel, next_id())
+
+    async def send(self, content=None, embed=None, **kwargs):
+        return await self.channel.send(content, embed=embed)
+
+
+class FakeWorld:
+    """Guilds and channels the patched bot.get_guild / bot.get_channel resolve"""
+
+    def __init__(self):
+        self.guilds = {}
+        self.channels = {}
+        main.bot.get_guild = self.guilds.get
+        main.bot.get_channel = self.channels.get
+
+    def guild(self, member_count=0):
+        guild = FakeGuild(next_id(), member_count)
+        self.guilds[guild.id] = guild
+        return guild
+
+    def channel(self, guild, name="bench"):
+        channel = FakeChannel(guild, name)
+        self.channels[channel.id] = channel
+        return channel
+
+    def host(self, guild):
+        """Member holding the tournament host role"""
+        main.storage.set_roles(guild.id, 'tournament_host', [HOST_ROLE_ID])
+        return guild.add_member("host", roles=[FakeRole(HOST_ROLE_ID)])
+
+
+async def settle():
+    """Let coalesced renders, queued rewards and write-behind saves finish"""
+    await main.state.drain()
+    await main.leaderboard_refresher.drain()
+    await main.tournament_renderer.drain()
+    await main.tournament_saver.flush()
+    await main.storage.flush()
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+async def measure(name, ops, concurrent=False, trace=True):
+    """Run zero-argument coroutine functions, timing each one and the whole batch including settle()"""
+    latencies = []
+
+    async def timed(op):
+        started = time.perf_counter()
+        await op()
+        latencies.append(time.perf_counter() - started)
+
+    if trace:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    if concurrent:
+        await asyncio.gather(*(timed(op) for op in ops))
+    else:
+        for op in ops:
+            await timed(op)
+    await settle()
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1] - baseline if trace else None
+
+    latencies.sort()
+    return {
+        'workload': name,
+        'ops': len(latencies),
+        'seconds': elapsed,
+        'ops_per_sec': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'peak_mb': peak / 2 ** 20 if peak is not None else None
+    }
+
+
+def open_tournament(world, guild, channel, max_players):
+    tournament = main.get_tournament(guild.id)
+    tournament.max_players = max_players
+    tournament.active = True
+    tournament.channel_id = channel.id
+    return tournament
+
+
+async def bench_registration(world, scale, trace):
+    """A burst of players pressing Register at the same time"""
+    count = int(1000 * scale)
+    guild = world.guild(count)
+    channel = world.channel(guild)
+    tournament = open_tournament(world, guild, channel, main.MAX_TOURNAMENT_PLAYERS)
+    message = await channel.send(embed=main.build_tournament_embed(tournament, guild.id))
+    tournament.message_id = message.id
+
+    view = main.TournamentView()
+    ops = [lambda member=member: main.TournamentView.register(
+               view, FakeInteraction(guild, member, channel), None)
+           for member in guild.members]
+    result = await measure('registration', ops, concurrent=True, trace=trace)
+    result['registered'] = len(tournament.roster)
+    return result
+
+
+async def run_bracket(world, guild, channel, host, fmt, players):
+    tournament = open_tournament(world, guild, channel, len(players))
+    tournament.settings['format'] = fmt
+    for member in players:
+        tournament.add_player(member)
+    ctx = FakeContext(guild, host, channel)
+    await main.start.callback(ctx)
+
+    ops = []
+    while main.tournaments.get(guild.id) is tournament:
+        undecided = [m for m in tournament.rounds[-1].matches if m.winner is None]
+        if not undecided:
+            raise RuntimeError(f"{fmt} round {len(tournament.rounds)} has nothing to decide")
+        match = random.choice(undecided)
+        member = guild.get_member(random.choice((match.player1, match.player2)))
+        started = time.perf_counter()
+        await main.winner.callback(ctx, member)
+        ops.append(time.perf_counter() - started)
+    return ops
+
+
+async def bench_bracket(world, scale, trace):
+    """Full tournaments in every format, one !winner per decided match"""
+    sizes = {'single': 256, 'double': 256, 'swiss': 256, 'round_robin': 32}
+    runs = []
+    for fmt in main.FORMATS:
+        guild = world.guild(max(2, int(sizes[fmt] * scale)))
+        players = guild.members
+        runs.append((guild, world.channel(guild), world.host(guild), fmt, players))
+    latencies = []
+
+    async def run_all():
+        for guild, channel, host, fmt, players in runs:
+            latencies.extend(await run_bracket(world, guild, channel, host, fmt, players))
+
+    result = await measure('bracket', [run_all], trace=trace)
+    # Per-op numbers are the individual !winner calls, not the whole run
+    latencies.sort()
+    result.update(ops=len(latencies),
+                  ops_per_sec=len(latencies) / result['seconds'],
+                  p50_ms=percentile(latencies, 0.50) * 1000,
+                  p99_ms=percentile(latencies, 0.99) * 1000)
+    return result
+
+
+async def bench_rewards(world, scale, trace):
+    """Reward events from many concurrent commands, ending in one leaderboard rebuild"""
+    count = int(10000 * scale)
+    guild = world.guild(1000)
+    channel = world.channel(guild, "log")
+    main.storage.set_log_channel(guild.id, channel.id)
+    members = guild.members
+
+    ops = [lambda member=random.choice(members): main.add_rp(guild.id, member.id, random.randint(1, 50))
+           for _ in range(count)]
+    result = await measure('rewards', ops, concurrent=True, trace=trace)
+    result['writes'] = main.state.stats()['writes']
+    return result
+
+
+def seed_scores(guild):
+    changes = []
+    for member in guild.members:
+        changes.append((member.id, 'rp', random.randint(0, 5000)))
+        if random.random() < 0.05:
+            changes.append((member.id, 'crown', random.randint(1, 5)))
+        if random.random() < 0.01:
+            changes.append((member.id, 'brkt_add', "🥇"))
+    main.storage.apply_rewards(guild.id, changes)
+
+
+async def bench_leaderboard(world, scale, trace):
+    """Rebuilding the log channel leaderboard of a very large guild after score changes"""
+    guild = world.guild(int(50000 * scale))
+    channel = world.channel(guild, "log")
+    main.storage.set_log_channel(guild.id, channel.id)
+    seed_scores(guild)
+    members = guild.members
+
+    async def rebuild():
+        # A few changes per rebuild so some pages differ and get edited
+        for member in random.sample(members, min(20, len(members))):
+            main.storage.add_rp(guild.id, member.id, random.randint(1, 500))
+        await main.update_log_embed(guild.id, channel)
+
+    result = await measure('leaderboard', [rebuild] * 5, trace=trace)
+    result['pages'] = len(main.storage.get_leaderboard_pages(guild.id))
+    return result
+
+
+async def leaderboard_channel(world, scale):
+    guild = world.guild(int(50000 * scale))
+    channel = world.channel(guild, "log")
+    main.storage.set_log_channel(guild.id, channel.id)
+    seed_scores(guild)
+    await main.update_log_embed(guild.id, channel)
+    return channel
+
+
+async def restore_from(channel):
+    if not await main.parse_leaderboard_data(channel):
+        raise RuntimeError("restore found no leaderboard")
+
+
+async def bench_restore(world, scale, trace):
+    """Restoring scores from leaderboard messages through the user IDs in their footers"""
+    channel = await leaderboard_channel(world, scale)
+    return await measure('restore', [lambda: restore_from(channel)] * 5, trace=trace)
+
+
+async def bench_restore_names(world, scale, trace):
+    """Restoring scores from older leaderboard messages without footer IDs, matched by member names"""
+    channel = await leaderboard_channel(world, scale)
+    for message in channel.messages.values():
+        message.embeds[0].remove_footer()
+    return await measure('restore_names', [lambda: restore_from(channel)] * 5, trace=trace)
+
+
+WORKLOADS = {
+    'registration': bench_registration,
+    'bracket': bench_bracket,
+    'rewards': bench_rewards,
+    'leaderboard': bench_leaderboard,
+    'restore': bench_restore,
+    'restore_names': bench_restore_names
+}
+
+
+def print_results(results):
+    print(f"{'workload':<14}{'ops':>8}{'ops/sec':>12}{'p50 ms':>10}{'p99 ms':>10}{'peak MB':>10}{'wall s':>9}")
+    for r in results:
+        peak = f"{r['peak_mb']:.1f}" if r['peak_mb'] is not None else "-"
+        print(f"{r['workload']:<14}{r['ops']:>8}{r['ops_per_sec']:>12.1f}{r['p50_ms']:>10.2f}"
+              f"{r['p99_ms']:>10.2f}{peak:>10}{r['seconds']:>9.2f}")
+
+
+def compare(results, baseline, tolerance):
+    """Workloads whose throughput fell more than tolerance below the baseline"""
+    previous = {r['workload']: r for r in baseline['results']}
+    regressions = []
+    for r in results:
+        old = previous.get(r['workload'])
+        if old and r['ops_per_sec'] < old['ops_per_sec'] * (1 - tolerance):
+            regressions.append((r['workload'], old['ops_per_sec'], r['ops_per_sec']))
+    return regressions
+
+
+async def run(args):
+    global API_LATENCY
+    API_LATENCY = args.latency
+    random.seed(args.seed)
+    main.storage.load()
+    world = FakeWorld()
+
+    results = []
+    for name in args.workloads or list(WORKLOADS):
+        print(f"⏱️ Running {name}...")
+        results.append(await WORKLOADS[name](world, args.scale, not args.no_memory))
+    main.storage.close()
+    main.offloader.shutdown()
+    return results
+
+
+def main_cli():
+    global main
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('workloads', nargs='*',
+                        help=f"workloads to run, all by default: {', '.join(WORKLOADS)}")
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help="multiply every workload's size")
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="simulated seconds per Discord REST call")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', action='store_true',
+                        help="skip tracemalloc, which slows everything down")
+    parser.add_argument('--save', help="write results as JSON")
+    parser.add_argument('--baseline', help="JSON from --save to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="allowed ops/sec drop against the baseline")
+    args = parser.parse_args()
+    unknown = set(args.workloads) - set(WORKLOADS)
+    if unknown:
+        parser.error(f"unknown workload(s): {', '.join(sorted(unknown))}")
+
+    # Storage files go to a scratch directory, renders run as soon as they're requested.
+    # Done here rather than at import, since the worker processes re-import this module
+    for name in ('LEADERBOARD_REFRESH_SECONDS', 'LEADERBOARD_REFRESH_DELAY',
+                 'TOURNAMENT_RENDER_SECONDS', 'TOURNAMENT_RENDER_DELAY'):
+        os.environ.setdefault(name, '0')
+    with tempfile.TemporaryDirectory(prefix='bot-bench-') as scratch:
+        os.chdir(scratch)
+        try:
+            sys.path.insert(0, REPO_DIR)
+            import main
+
+            print(f"📦 Storage backend: {main.STORAGE_BACKEND}, scratch dir {scratch}")
+            if not args.no_memory:
+                tracemalloc.start()
+            results = asyncio.run(run(args))
+        finally:
+            os.chdir(REPO_DIR)
+    print_results(results)
+
+    if args.save:
+        with open(os.path.join(REPO_DIR, args.save) if not os.path.isabs(args.save) else args.save, 'w') as f:
+            json.dump({'backend': main.STORAGE_BACKEND, 'scale': args.scale,
+                       'results': results}, f, indent=2)
+        print(f"💾 Saved results to {args.save}")
+
+    if args.baseline:
+        path = args.baseline if os.path.isabs(args.baseline) else os.path.join(REPO_DIR, args.baseline)
+        with open(path) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for workload, old, new in regressions:
+            print(f"❌ {workload}: {new:.1f} ops/sec, baseline {old:.1f}")
+        if regressions:
+            sys.exit(1)
+        print("✅ No regressions against the baseline")
+
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,521 @@
+import math
+import random
+
+
+def bracket_size(players):
+    """Smallest power of two that fits every player, at least one match"""
+    size = 2
+    while size < players:
+        size *= 2
+    return size
+
+
+def seed_order(size):
+    """Seeds in bracket position order, adjacent pairs meet in round 1 (1, 8, 4, 5, 2, 7, 3, 6 for 8)"""
+    order = [1]
+    while len(order) < size:
+        total = len(order) * 2 + 1
+        order = [seed for high in order for seed in (high, total - high)]
+    return order
+
+
+class Match:
+    """One pairing of two player IDs; player2 is None for a bye"""
+
+    __slots__ = ('player1', 'player2', 'winner', 'side')
+
+    def __init__(self, player1, player2=None, winner=None, side=None):
+        self.player1 = player1
+        self.player2 = player2
+        # Byes advance automatically
+        self.winner = player1 if player2 is None and winner is None else winner
+        self.side = side  # 'winners', 'losers' or 'final' in double elimination
+
+    @property
+    def is_bye(self):
+        return self.player2 is None
+
+    @property
+    def loser(self):
+        if self.winner is None or self.is_bye:
+            return None
+        return self.player2 if self.winner == self.player1 else self.player1
+
+    def to_record(self):
+        if self.side:
+            return [self.player1, self.player2, self.winner, self.side]
+        return [self.player1, self.player2, self.winner]
+
+    @classmethod
+    def from_record(cls, record):
+        # Older records used "BYE" for player2 and only had a winner once decided
+        player1, player2 = record[0], record[1]
+        winner = record[2] if len(record) > 2 else None
+        side = record[3] if len(record) > 3 else None
+        return cls(player1, None if player2 == "BYE" else player2, winner, side)
+
+
+class Round:
+    """Matches of one round with a player -> match index and a count of undecided matches"""
+
+    __slots__ = ('matches', 'remaining', '_by_player')
+
+    def __init__(self, matches):
+        self.matches = matches
+        self.remaining = 0
+        self._by_player = {}
+        for match in matches:
+            self._by_player[match.player1] = match
+            if match.player2 is not None:
+                self._by_player[match.player2] = match
+            if match.winner is None:
+                self.remaining += 1
+
+    @classmethod
+    def pair(cls, player_ids, side=None):
+        """Pair players in order, an odd player out gets a bye"""
+        matches = [Match(player_ids[i], player_ids[i + 1], side=side)
+                   for i in range(0, len(player_ids) - 1, 2)]
+        if len(player_ids) % 2:
+            matches.append(Match(player_ids[-1], side=side))
+        return cls(matches)
+
+    @classmethod
+    def seeded(cls, player_ids, side=None):
+        """Standard seeded bracket for player_ids ordered best first
+
+        The field is padded to a power of two so seed 1 meets the lowest seed,
+        top seeds only meet late, and the byes go to the top seeds.
+        """
+        matches = []
+        order = seed_order(bracket_size(len(player_ids)))
+        for i in range(0, len(order), 2):
+            # The higher seed comes first and always exists, only the lower one can be padding
+            high, low = order[i], order[i + 1]
+            player2 = player_ids[low - 1] if low <= len(player_ids) else None
+            matches.append(Match(player_ids[high - 1], player2, side=side))
+        return cls(matches)
+
+    def match_for(self, player_id):
+        return self._by_player.get(player_id)
+
+    def record_winner(self, player_id):
+        """Mark player_id as winner of their match, returns the match or None if they have none"""
+        match = self._by_player.get(player_id)
+        if match is None or match.is_bye:
+            return None
+        if match.winner is None:
+            self.remaining -= 1
+        match.winner = player_id
+        return match
+
+    @property
+    def complete(self):
+        return self.remaining == 0
+
+    def winners(self):
+        return [match.winner for match in self.matches]
+
+    def to_record(self):
+        return [match.to_record() for match in self.matches]
+
+    @classmethod
+    def from_record(cls, record):
+        return cls([Match.from_record(match) for match in record])
+
+
+class Format:
+    """Tournament format producing rounds one at a time from the results of the last
+
+    seeds lists every player ID, best first for seeded events; later rounds are
+    only built once advance() has folded the completed round into the standings.
+    """
+
+    name = None
+    label = None
+    scored = False  # Ranked by points rather than by elimination
+
+    def __init__(self, seeds, seeded=False):
+        self.seeds = list(seeds)
+        self.seeded = seeded
+        self.rounds = []
+        self.finished = False
+
+    @property
+    def current_round(self):
+        return self.rounds[-1] if self.rounds else None
+
+    def start(self):
+        self.rounds = [self._first_round()]
+        return self.rounds[0]
+
+    def advance(self):
+        """Fold in the completed current round, returns the next round or None once the event is over"""
+        self._complete(self.rounds[-1])
+        next_round = self._next_round()
+        if next_round is None:
+            self.finished = True
+        else:
+            self.rounds.append(next_round)
+        return next_round
+
+    def standings(self):
+        """Player IDs grouped by final placement, best first; ties share a group"""
+        raise NotImplementedError
+
+    def placements(self):
+        """(place, player_id) pairs best first, one distinct place per player
+
+        Players tied in a standings group (e.g. both semifinal losers) are
+        ordered by seed, so every paid place goes to exactly one player.
+        """
+        seed_index = {player_id: i for i, player_id in enumerate(self.seeds)}
+        ranked = [player_id for group in self.standings()
+                  for player_id in sorted(group, key=seed_index.__getitem__)]
+        return list(enumerate(ranked, 1))
+
+    def score(self, player_id):
+        """Points of a player in scored formats"""
+        return None
+
+    def _first_round(self):
+        raise NotImplementedError
+
+    def _next_round(self):
+        raise NotImplementedError
+
+    def _complete(self, round_matches):
+        raise NotImplementedError
+
+    def _order(self, player_ids):
+        """Players in bracket order when seeded, otherwise shuffled"""
+        if not self.seeded:
+            player_ids = list(player_ids)
+            random.shuffle(player_ids)
+        return player_ids
+
+    def to_record(self):
+        return {
+            'format': self.name,
+            'seeds': self.seeds,
+            'seeded': self.seeded,
+            'finished': self.finished,
+            'rounds': [round_matches.to_record() for round_matches in self.rounds]
+        }
+
+    @staticmethod
+    def from_record(record):
+        fmt = FORMATS[record.get('format', 'single')](record['seeds'], record.get('seeded', False))
+        fmt.rounds = [Round.from_record(r) for r in record['rounds']]
+        # Replay results so the incremental standings match the stored rounds
+        completed = fmt.rounds if record.get('finished') else fmt.rounds[:-1]
+        for round_matches in completed:
+            fmt._complete(round_matches)
+        fmt.finished = record.get('finished', False)
+        return fmt
+
+
+class SingleElimination(Format):
+    """Knockout bracket, one loss eliminates"""
+
+    name = 'single'
+    label = "Single Elimination"
+
+    def __init__(self, seeds, seeded=False):
+        super().__init__(seeds, seeded)
+        self.alive = []
+        self.eliminated = []  # One group of losers per round
+
+    def _first_round(self):
+        if self.seeded:
+            return Round.seeded(self.seeds)
+        return Round.pair(self.seeds)
+
+    def _complete(self, round_matches):
+        self.alive = round_matches.winners()
+        self.eliminated.append([m.loser for m in round_matches.matches if not m.is_bye])
+
+    def _next_round(self):
+        if len(self.alive) < 2:
+            return None
+        # Seeded winners stay in bracket order so neighbouring matches meet
+        return Round.pair(self._order(self.alive))
+
+    def standings(self):
+        return [self.alive] + [group for group in reversed(self.eliminated) if group]
+
+
+class DoubleElimination(Format):
+    """Winners and losers brackets, a second loss eliminates
+
+    Both brackets play each round side by side, losers of the winners bracket drop
+    into the losers bracket, and the two bracket winners meet in a grand final
+    that is replayed once if the losers bracket side wins it.
+    """
+
+    name = 'double'
+    label = "Double Elimination"
+
+    def __init__(self, seeds, seeded=False):
+        super().__init__(seeds, seeded)
+        self.winners_side = list(self.seeds)
+        self.losers_side = []
+        self.eliminated = []  # One group of players knocked out per round
+
+    def _first_round(self):
+        if self.seeded:
+            return Round.seeded(self.seeds, side='winners')
+        return Round.pair(self.seeds, side='winners')
+
+    def _complete(self, round_matches):
+        winners_side = []
+        losers_side = []
+        dropped = []
+        out = []
+        for match in round_matches.matches:
+            if match.side == 'losers':
+                losers_side.append(match.winner)
+                if match.loser is not None:
+                    out.append(match.loser)
+            elif match.side == 'final':
+                # Whoever loses the final with a clean record gets a rematch
+                loser = match.loser
+                if loser in self.winners_side:
+                    losers_side.append(loser)
+                else:
+                    out.append(loser)
+                if match.winner in self.winners_side:
+                    winners_side.append(match.winner)
+                else:
+                    losers_side.append(match.winner)
+            else:
+                winners_side.append(match.winner)
+                if match.loser is not None:
+                    dropped.append(match.loser)
+
+        # A bracket champion sitting out this round keeps their place
+        winners_side += [p for p in self.winners_side if round_matches.match_for(p) is None]
+        losers_side += [p for p in self.losers_side if round_matches.match_for(p) is None]
+
+        self.winners_side = winners_side
+        self.losers_side = losers_side + dropped
+        self.eliminated.append(out)
+
+    def _next_round(self):
+        winners_side = self._order(self.winners_side)
+        losers_side = self._order(self.losers_side)
+        if len(winners_side) + len(losers_side) < 2:
+            return None
+        if len(winners_side) + len(losers_side) == 2:
+            return Round([Match(*(winners_side + losers_side), side='final')])
+
+        matches = []
+        if len(winners_side) >= 2:
+            matches += Round.pair(winners_side, side='winners').matches
+        if len(losers_side) >= 2 or (losers_side and len(winners_side) >= 2):
+            matches += Round.pair(losers_side, side='losers').matches
+        return Round(matches)
+
+    def standings(self):
+        alive = self.winners_side + self.losers_side
+        return [alive] + [group for group in reversed(self.eliminated) if group]
+
+
+class RoundRobin(Format):
+    """Everyone plays everyone once, pairings from the circle method"""
+
+    name = 'round_robin'
+    label = "Round Robin"
+    scored = True
+
+    def __init__(self, seeds, seeded=False):
+        super().__init__(seeds, seeded)
+        self.wins = dict.fromkeys(self.seeds, 0)
+        # An odd field gets a resting slot, whoever meets it has a bye
+        self.circle = self.seeds + [None] if len(self.seeds) % 2 else list(self.seeds)
+
+    @property
+    def total_rounds(self):
+        return len(self.circle) - 1
+
+    def _pairings(self, index):
+        # Keep the first slot fixed and rotate the rest by one position per round
+        rest = self.circle[1:]
+        shift = index % len(rest)
+        order = [self.circle[0]] + rest[-shift:] + rest[:-shift] if shift else list(self.circle)
+        matches = []
+        for i in range(len(order) // 2):
+            player1, player2 = order[i], order[-1 - i]
+            if player1 is None:
+                player1, player2 = player2, None
+            matches.append(Match(player1, player2))
+        return Round(matches)
+
+    def _first_round(self):
+        return self._pairings(0)
+
+    def _complete(self, round_matches):
+        for match in round_matches.matches:
+            if not match.is_bye:
+                self.wins[match.winner] += 1
+
+    def _next_round(self):
+        if len(self.rounds) >= self.total_rounds:
+            return None
+        return self._pairings(len(self.rounds))
+
+    def score(self, player_id):
+        return self.wins.get(player_id, 0)
+
+    def standings(self):
+        seed_index = {player_id: i for i, player_id in enumerate(self.seeds)}
+        ranked = sorted(self.seeds, key=lambda p: (-self.wins[p], seed_index[p]))
+        return [[player_id] for player_id in ranked]
+
+
+class Swiss(Format):
+    """Fixed number of rounds pairing players on equal scores without rematches"""
+
+    name = 'swiss'
+    label = "Swiss"
+    scored = True
+    max_backtracks = 10000  # Search budget before rematches are allowed
+
+    def __init__(self, seeds, seeded=False):
+        super().__init__(seeds, seeded)
+        self.points = dict.fromkeys(self.seeds, 0)
+        self.opponents = {player_id: set() for player_id in self.seeds}
+        self.had_bye = set()
+        self.seed_index = {player_id: i for i, player_id in enumerate(self.seeds)}
+        self.total_rounds = max(1, math.ceil(math.log2(max(len(self.seeds), 2))))
+
+    def _ranked(self):
+        return sorted(self.seeds, key=lambda p: (-self.points[p], self.seed_index[p]))
+
+    def _take_bye(self, ranked):
+        """Lowest ranked player without a bye sits out when the field is odd"""
+        if len(ranked) % 2 == 0:
+            return None
+        for player_id in reversed(ranked):
+            if player_id not in self.had_bye:
+                ranked.remove(player_id)
+                return player_id
+        return ranked.pop()
+
+    def _first_round(self):
+        ranked = list(self.seeds)
+        bye = self._take_bye(ranked)
+        # Top half meets bottom half
+        half = len(ranked) // 2
+        matches = [Match(ranked[i], ranked[i + half]) for i in range(half)]
+        if bye is not None:
+            matches.append(Match(bye))
+        return Round(matches)
+
+    def _complete(self, round_matches):
+        for match in round_matches.matches:
+            self.points[match.winner] += 1
+            if match.is_bye:
+                self.had_bye.add(match.player1)
+            else:
+                self.opponents[match.player1].add(match.player2)
+                self.opponents[match.player2].add(match.player1)
+
+    def _pair_without_rematches(self, ranked):
+        """Pair down the standings, backtracking over earlier pairings instead of accepting a rematch
+
+        Each player takes the closest-ranked opponent they haven't met; when someone
+        is left with only rematches, the latest pairing moves on to its next candidate.
+        Returns None if no rematch-free pairing turns up within max_backtracks.
+        """
+        count = len(ranked)
+        used = [False] * count
+        stack = []  # (i, j) index pairs taken so far
+        i, j = 0, 1  # ranked[i] is the best unpaired player, candidates start at j
+        backtracks = 0
+        while i < count:
+            met = self.opponents[ranked[i]]
+            while j < count and (used[j] or ranked[j] in met):
+                j += 1
+            if j < count:
+                used[i] = used[j] = True
+                stack.append((i, j))
+                while i < count and used[i]:
+                    i += 1
+                j = i + 1
+                continue
+            backtracks += 1
+            if not stack or backtracks > self.max_backtracks:
+                return None
+            i, j = stack.pop()
+            used[i] = used[j] = False
+            j += 1
+        return [Match(ranked[i], ranked[j]) for i, j in stack]
+
+    def _pair_greedy(self, ranked):
+        """Fallback pairing that accepts rematches where it has to"""
+        # Unpaired players are kept in a linked list so skipping over
+        # rematches doesn't rescan players already paired
+        following = {ranked[i]: ranked[i + 1] if i + 1 < len(ranked) else None
+                     for i in range(len(ranked))}
+        preceding = {ranked[i]: ranked[i - 1] if i else None for i in range(len(ranked))}
+        head = ranked[0] if ranked else None
+
+        def unlink(player_id):
+            nonlocal head
+            before, after = preceding[player_id], following[player_id]
+            if before is None:
+                head = after
+            else:
+                following[before] = after
+            if after is not None:
+                preceding[after] = before
+
+        matches = []
+        while head is not None:
+            player1 = head
+            unlink(player1)
+            player2 = head
+            candidate = head
+            while candidate is not None and candidate in self.opponents[player1]:
+                candidate = following[candidate]
+            if candidate is not None:
+                player2 = candidate
+            unlink(player2)
+            if candidate is None:
+                # Everyone left is a rematch, swap opponents with the nearest earlier pairing that allows it
+                for match in reversed(matches):
+                    if (match.player2 not in self.opponents[player1] and
+                            player2 not in self.opponents[match.player1]):
+                        match.player2, player2 = player2, match.player2
+                        break
+            matches.append(Match(player1, player2))
+
+        return matches
+
+    def _next_round(self):
+        if len(self.rounds) >= self.total_rounds:
+            return None
+
+        ranked = self._ranked()
+        bye = self._take_bye(ranked)
+        matches = self._pair_without_rematches(ranked)
+        if matches is None:
+            matches = self._pair_greedy(ranked)
+
+        if bye is not None:
+            matches.append(Match(bye))
+        return Round(matches)
+
+    def score(self, player_id):
+        return self.points.get(player_id, 0)
+
+    def standings(self):
+        # Ties on points are broken by opponents' points (Buchholz), then seed
+        def key(player_id):
+            buchholz = sum(self.points[o] for o in self.opponents[player_id])
+            return (-self.points[player_id], -buchholz, self.seed_index[player_id])
+        return [[player_id] for player_id in sorted(self.seeds, key=key)]
+
+
+FORMATS = {fmt.name: fmt for fmt in (SingleElimination, DoubleElimination, RoundRobin, Swiss)}
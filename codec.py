@@ -0,0 +1,146 @@
+import json
+import struct
+import sys
+from array import array
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Score tables packed by the binary format: {guild_id: {user_id: int}}
+SCORE_TABLES = ('rp_data', 'crown_data')
+BINARY_MAGIC = b'UDBIN\x01'
+_HEADER = struct.Struct('<6sI')  # magic, length of the JSON metadata block
+_INT32 = (-2 ** 31, 2 ** 31 - 1)
+
+
+def _json_bytes(data):
+    if orjson is not None:
+        try:
+            return orjson.dumps(data)
+        except TypeError:
+            pass  # Integers beyond 64 bits, only the stdlib handles those
+    return json.dumps(data, separators=(',', ':')).encode()
+
+
+def _json_loads(payload):
+    if orjson is not None:
+        return orjson.loads(payload)
+    return json.loads(payload)
+
+
+def _is_snowflake(key):
+    """True for a canonical decimal ID string that round-trips through int"""
+    return key.isascii() and key.isdigit() and (key == '0' or key[0] != '0') and int(key) < 2 ** 64
+
+
+def _pack_table(users):
+    """(typecode, id bytes, value bytes) for one guild, or None if it can't be packed"""
+    keys = list(users)
+    if keys:
+        # Checked on the joined string so the common case stays in C
+        joined = ''.join(keys)
+        if not (joined.isascii() and joined.isdigit()) or min(keys)[:1] in ('', '0'):
+            return None
+    try:
+        id_array = array('Q', map(int, keys))
+        value_array = array('q', users.values())
+    except (TypeError, OverflowError):
+        return None
+
+    typecode = 'q'
+    if value_array and _INT32[0] <= min(value_array) and max(value_array) <= _INT32[1]:
+        typecode = 'i'
+        value_array = array('i', value_array)
+    if sys.byteorder == 'big':
+        id_array.byteswap()
+        value_array.byteswap()
+    return typecode, id_array.tobytes(), value_array.tobytes()
+
+
+def encode_binary(data):
+    """Score tables as packed little-endian uint64 IDs + int32/int64 values, everything else as JSON
+
+    Guilds whose keys or values don't fit the packed form stay in the JSON block.
+    """
+    meta = dict(data)
+    tables = []
+    blobs = []
+    for name in SCORE_TABLES:
+        loose = {}
+        for guild_str, users in data.get(name, {}).items():
+            packed = _pack_table(users) if _is_snowflake(guild_str) else None
+            if packed is None:
+                loose[guild_str] = users
+                continue
+            typecode, id_bytes, value_bytes = packed
+            tables.append([name, guild_str, len(users), typecode])
+            blobs += (id_bytes, value_bytes)
+        if name in data:
+            meta[name] = loose
+    meta['_tables'] = tables
+
+    meta_bytes = _json_bytes(meta)
+    return b''.join([_HEADER.pack(BINARY_MAGIC, len(meta_bytes)), meta_bytes] + blobs)
+
+
+def decode_binary(payload):
+    view = memoryview(payload)
+    try:
+        _, meta_size = _HEADER.unpack_from(view)
+    except struct.error:
+        raise ValueError("truncated binary data file")
+    offset = _HEADER.size
+    data = _json_loads(bytes(view[offset:offset + meta_size]))
+    offset += meta_size
+
+    for name, guild_str, count, typecode in data.pop('_tables', []):
+        ids = array('Q')
+        values = array(typecode)
+        id_end = offset + count * ids.itemsize
+        value_end = id_end + count * values.itemsize
+        if value_end > len(view):
+            raise ValueError("truncated binary data file")
+        ids.frombytes(view[offset:id_end])
+        values.frombytes(view[id_end:value_end])
+        if sys.byteorder == 'big':
+            ids.byteswap()
+            values.byteswap()
+        offset = value_end
+        data.setdefault(name, {})[guild_str] = dict(zip(map(str, ids), values.tolist()))
+    return data
+
+
+def encode_pretty(data):
+    """Indented stdlib JSON, the original human-readable format (its encoder is pure Python)"""
+    return json.dumps(data, indent=2).encode()
+
+
+def encode_json(data):
+    """Compact JSON, through orjson when it is installed"""
+    return _json_bytes(data)
+
+
+ENCODERS = {
+    'pretty': encode_pretty,
+    'json': encode_json,
+    'binary': encode_binary
+}
+
+
+def encode(data, fmt='json'):
+    """Serialize a storage snapshot to bytes in the named format"""
+    if fmt not in ENCODERS:
+        raise ValueError(f"Unknown data format {fmt}")
+    return ENCODERS[fmt](data)
+
+
+def decode(payload):
+    """Parse a snapshot written in any format, detected from its first bytes
+
+    Raises ValueError for corrupt or truncated data.
+    """
+    if payload.startswith(BINARY_MAGIC):
+        return decode_binary(payload)
+    return _json_loads(payload)
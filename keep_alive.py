@@ -1,16 +1,35 @@
-from flask import Flask
-from threading import Thread
+import json
 
-app = Flask('')
+from aiohttp import web
 
-@app.route('/')
-def home():
-    return "Bot is alive!"
 
-def run():
-    app.run(host='0.0.0.0', port=8080)
+async def start_keep_alive(status, host='0.0.0.0', port=8080, metrics_text=None):
+    """Serve /, /healthz and /metrics on the running event loop, returns the runner for cleanup()
 
-def keep_alive():
-    t = Thread(target=run)
-    t.daemon = True
-    t.start()
+    status is a callable returning a dict; its 'ready' key decides between 200 and 503.
+    metrics_text returns the Prometheus exposition served on /metrics.
+    """
+
+    async def home(request):
+        return web.Response(text="Bot is alive!")
+
+    async def healthz(request):
+        report = status()
+        return web.Response(text=json.dumps(report),
+                            content_type='application/json',
+                            status=200 if report.get('ready') else 503)
+
+    async def prometheus(request):
+        return web.Response(text=metrics_text(), content_type='text/plain',
+                            headers={'X-Content-Type-Options': 'nosniff'})
+
+    app = web.Application()
+    app.router.add_get('/', home)
+    app.router.add_get('/healthz', healthz)
+    if metrics_text is not None:
+        app.router.add_get('/metrics', prometheus)
+
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
@@ -0,0 +1,250 @@
+import re
+from itertools import islice
+
+from sortedcontainers import SortedList
+
+RANKED_EMOJI = '<:Ranked:1411317994847473695>'
+CROWN_EMOJI = '<:Crown:1394255336310968434>'
+
+
+class GuildRanking:
+    """Order-statistics index of one guild's leaderboard, updated per user in O(log n)
+
+    Entries are ordered by (-rp, -crowns, user_id) and include everyone with RP,
+    crowns or bracket emojis, the same population the log channel leaderboard shows.
+    """
+
+    def __init__(self):
+        self.entries = {}  # user_id -> (rp, crowns, has_brackets)
+        self.by_rp = SortedList()
+        self.by_crowns = SortedList()
+        self.scoring = 0  # Entries with RP or crowns above zero
+
+    @staticmethod
+    def _is_scoring(rp, crowns):
+        return rp > 0 or crowns > 0
+
+    def update(self, user_id, rp, crowns, has_brackets):
+        """Insert, move or drop a user after their values changed"""
+        old = self.entries.pop(user_id, None)
+        if old is not None:
+            old_rp, old_crowns, _ = old
+            self.by_rp.remove((-old_rp, -old_crowns, user_id))
+            if old_crowns > 0:
+                self.by_crowns.remove((-old_crowns, user_id))
+            if self._is_scoring(old_rp, old_crowns):
+                self.scoring -= 1
+
+        if self._is_scoring(rp, crowns) or has_brackets:
+            self.entries[user_id] = (rp, crowns, has_brackets)
+            self.by_rp.add((-rp, -crowns, user_id))
+            if crowns > 0:
+                self.by_crowns.add((-crowns, user_id))
+            if self._is_scoring(rp, crowns):
+                self.scoring += 1
+
+    def ordered(self):
+        """Every entry as (user_id, rp, crowns) in leaderboard order"""
+        return ((user_id, -neg_rp, -neg_crowns) for neg_rp, neg_crowns, user_id in self.by_rp)
+
+    def top(self, by='rp', limit=10, offset=0):
+        """Rows for one page of the RP or crown leaderboard"""
+        if by == 'crowns':
+            keys = self.by_crowns.islice(offset, offset + limit)
+            return [(user_id, self.entries[user_id][0], -neg_crowns)
+                    for neg_crowns, user_id in keys]
+
+        scoring = (row for row in self.ordered() if self._is_scoring(row[1], row[2]))
+        return list(islice(scoring, offset, offset + limit))
+
+    def rank(self, user_id):
+        """(position, total) on the RP leaderboard, or None if the user has no RP/crowns"""
+        entry = self.entries.get(user_id)
+        if entry is None or not self._is_scoring(entry[0], entry[1]):
+            return None
+        rp, crowns, _ = entry
+        return self.by_rp.index((-rp, -crowns, user_id)) + 1, self.scoring
+
+
+def paginate_lines(lines, max_chars):
+    """Split lines into newline-joined chunks of at most max_chars each"""
+    return [chunk for chunk, _ in paginate_tagged_lines(lines, max_chars)]
+
+
+def paginate_tagged_lines(lines, max_chars, tags=None, max_tag_chars=None, max_total=None):
+    """Split lines into (chunk, chunk_tags) pages
+
+    tags holds one short string per line (an encoded user ID); each page keeps its
+    '.'-joined tags within max_tag_chars and chunk plus tags within max_total.
+    """
+    pages = []
+    current = []
+    current_tags = []
+    size = 0
+    tag_size = 0
+    for i, line in enumerate(lines):
+        line = line[:max_chars]
+        tag = tags[i] if tags is not None else None
+        # +1 for the separator joining it to the previous line/tag
+        added = len(line) + (1 if current else 0)
+        tag_added = len(tag) + (1 if current_tags else 0) if tag is not None else 0
+
+        if current and (size + added > max_chars or
+                        (max_tag_chars is not None and tag_size + tag_added > max_tag_chars) or
+                        (max_total is not None and size + added + tag_size + tag_added > max_total)):
+            pages.append(("\n".join(current), current_tags))
+            current = []
+            current_tags = []
+            size = tag_size = 0
+            added = len(line)
+            tag_added = len(tag) if tag is not None else 0
+
+        current.append(line)
+        if tag is not None:
+            current_tags.append(tag)
+        size += added
+        tag_size += tag_added
+    if current:
+        pages.append(("\n".join(current), current_tags))
+    return pages
+
+
+_B36_DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+
+def encode_id(user_id):
+    """Base36 form of a snowflake, 13 characters instead of 19"""
+    digits = []
+    while True:
+        user_id, rem = divmod(user_id, 36)
+        digits.append(_B36_DIGITS[rem])
+        if not user_id:
+            return ''.join(reversed(digits))
+
+
+def encode_ids(encoded):
+    """Machine-readable footer suffix listing the user of every line on a page"""
+    return 'ids:' + '.'.join(encoded)
+
+
+def decode_ids(text):
+    """User IDs embedded by encode_ids(), or None if the text has none"""
+    if not text or 'ids:' not in text:
+        return None
+    part = text.split('ids:', 1)[1].strip()
+    if not part:
+        return []
+    try:
+        return [int(token, 36) for token in part.split('.')]
+    except ValueError:
+        return None
+
+
+RANK_PREFIX = re.compile(r'^(?:🥇|🥈|🥉|\*\*\d+\.\*\*)\s*')
+MEDALS = ('🥇', '🥈', '🥉')
+
+
+def parse_leaderboard_line(line):
+    """Split one rendered leaderboard line into (name, rp, crowns, brackets), or None"""
+    # Line format: "**4.** Username 🥇 - 100<:Ranked:...> 5<:Crown:...> ⏱️ 🥇"
+    if '<:Ranked:' not in line:
+        return None
+    content = RANK_PREFIX.sub('', line.strip(), count=1)
+    if ' - ' not in content:
+        return None
+    name, data = content.rsplit(' - ', 1)
+    name = name.strip()
+
+    rp = None
+    try:
+        rp = int(data.split('<:Ranked:')[0].split()[-1])
+    except (ValueError, IndexError):
+        pass
+
+    crowns = None
+    if '<:Crown:' in data:
+        try:
+            crowns = int(data.split('<:Crown:')[0].split()[-1])
+        except (ValueError, IndexError):
+            pass
+
+    brackets = []
+    if '⏱️' in data:
+        brackets = data.split('⏱️', 1)[1].split()
+
+    # Medal bracket emojis are rendered as part of the name
+    for emoji in MEDALS:
+        if emoji in name and emoji not in brackets:
+            brackets.append(emoji)
+
+    return name, rp, crowns, brackets
+
+
+def parse_leaderboard_lines(description):
+    """Parse every player line of a leaderboard page"""
+    rows = []
+    for line in description.split('\n'):
+        row = parse_leaderboard_line(line)
+        if row is not None:
+            rows.append(row)
+    return rows
+
+
+def parse_leaderboard_pages(pages):
+    """(rows, user_ids) for each (description, footer text) page
+
+    user_ids is None when the footer has no IDs or they don't line up with the rows.
+    Pure, so restores of huge leaderboards can run it in a worker process.
+    """
+    parsed = []
+    for description, footer in pages:
+        rows = parse_leaderboard_lines(description)
+        user_ids = decode_ids(footer)
+        if user_ids is not None and len(user_ids) != len(rows):
+            user_ids = None
+        parsed.append((rows, user_ids))
+    return parsed
+
+
+def render_leaderboard_pages(rows, page_chars, footer_chars, total_chars):
+    """(title, description, footer) pages of the log channel leaderboard
+
+    rows are (user_id, display name, rp, crowns, bracket emojis) in leaderboard
+    order. Pure, so huge guilds can render it in a worker process.
+    """
+    if not rows:
+        lines = ["No members with RP, Crowns, or Bracket roles found."]
+        tags = [None]
+    else:
+        lines = []
+        tags = []
+        for i, (user_id, display_name, rp, crowns, user_brackets) in enumerate(rows, 1):
+            # Ranking emojis only for gold/silver/bronze with RP > 0
+            if i <= 3 and rp > 0:
+                emoji = MEDALS[i - 1]
+            else:
+                emoji = f"**{i}.**"
+
+            line = f"{emoji} {display_name} - {rp}{RANKED_EMOJI}"
+            if crowns > 0:
+                line += f" {crowns}{CROWN_EMOJI}"
+
+            # Bracket emojis are usually part of the display name already
+            if user_brackets:
+                emojis = ''.join(user_brackets)
+                if emojis not in line:
+                    line += f" ⏱️ {emojis}"
+
+            lines.append(line)
+            tags.append(encode_id(user_id))
+
+    # The footer lists each line's user ID
+    pages = []
+    paginated = paginate_tagged_lines(lines, page_chars, tags,
+                                      max_tag_chars=footer_chars,
+                                      max_total=total_chars)
+    for i, (chunk, page_tags) in enumerate(paginated, 1):
+        title = "🏆 Server Leaderboard" if i == 1 else f"🏆 Server Leaderboard (Page {i})"
+        footer = f"Last updated • {encode_ids(page_tags)}" if page_tags else "Last updated"
+        pages.append((title, chunk, footer))
+    return pages
@@ -1,33 +1,196 @@
 import discord
 from discord.ext import commands
-import json
 import random
 import asyncio
+import hashlib
+import math
 import os
-from threading import Thread
-from keep_alive import keep_alive
+import time
+from itertools import islice
+from keep_alive import start_keep_alive
+from actor import GuildStateActor
+from bracket import FORMATS, Format
+from metrics import metrics, instrument_http, watch_rate_limits
+from offload import Offloader
+from profiling import StallDetector, profile_loop, sample_loop
+from leaderboard import (paginate_lines, parse_leaderboard_pages, render_leaderboard_pages)
+from rewards import parse_reward_lines, text_rows, csv_rows
+from scheduler import CoalescingScheduler
+from storage import create_storage
 from datetime import datetime
 
+DATA_FILE = 'user_data.json'
+BACKUP_FILE = 'user_data_backup.json'
+JOURNAL_FILE = 'user_data.journal'
+SQLITE_FILE = 'user_data.db'
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'json')  # 'json' or 'sqlite'
+# Format DATA_FILE is written in: 'json' (compact, orjson if installed), 'pretty' (indented)
+# or 'binary' (packed score tables). Any of them is detected on load, so this can change at any restart
+DATA_FORMAT = os.getenv('DATA_FORMAT', 'json')
+SAVE_DEBOUNCE_SECONDS = float(os.getenv('SAVE_DEBOUNCE_SECONDS', '2.0'))
+# Snapshot + compact the journal after this many records or seconds
+JOURNAL_COMPACT_RECORDS = int(os.getenv('JOURNAL_COMPACT_RECORDS', '500'))
+JOURNAL_COMPACT_SECONDS = float(os.getenv('JOURNAL_COMPACT_SECONDS', '300'))
+# Rebuild a guild's log channel leaderboard at most once per interval
+LEADERBOARD_REFRESH_SECONDS = float(os.getenv('LEADERBOARD_REFRESH_SECONDS', '10'))
+LEADERBOARD_REFRESH_DELAY = float(os.getenv('LEADERBOARD_REFRESH_DELAY', '1'))
+# Re-render a tournament's registration embed at most once per interval
+TOURNAMENT_RENDER_SECONDS = float(os.getenv('TOURNAMENT_RENDER_SECONDS', '5'))
+TOURNAMENT_RENDER_DELAY = float(os.getenv('TOURNAMENT_RENDER_DELAY', '1'))
+# Roster changes are saved at most once per interval instead of on every click
+TOURNAMENT_SAVE_SECONDS = float(os.getenv('TOURNAMENT_SAVE_SECONDS', '2'))
+TOURNAMENT_SAVE_DELAY = float(os.getenv('TOURNAMENT_SAVE_DELAY', '1'))
+# Description budget per leaderboard page (Discord allows 4096, and 6000 per embed in total)
+EMBED_PAGE_CHARS = 4000
+EMBED_FOOTER_CHARS = 2000  # Leaves room for the footer prefix under the 2048 limit
+EMBED_TOTAL_CHARS = 5900  # Leaves room for the title under the 6000 total
+EMBED_FIELD_CHARS = 1024  # Discord's limit per embed field value
+# Largest tournament a host can configure, brackets and rosters page beyond one embed
+MAX_TOURNAMENT_PLAYERS = int(os.getenv('MAX_TOURNAMENT_PLAYERS', '1024'))
+ROSTER_PAGE_SIZE = 50  # Players per !players page
+BULK_MAX_CHANGES = 1000  # Changes per !bulk command or CSV upload
+BULK_MAX_FILE_BYTES = 256 * 1024
+SEEDING_MODES = {'random': "Random", 'rp': "RP Ranking"}
+# Place -> (RP setting, crowns, bracket emoji); tied players all get their shared place
+PLACEMENT_REWARDS = {
+    1: ('rp_1st', 1, "🥇"),
+    2: ('rp_2nd', 0, "🥈"),
+    3: ('rp_3rd', 0, "🥉"),
+    4: ('rp_4th', 0, None)
+}
+ORDINALS = {1: "1st", 2: "2nd", 3: "3rd", 4: "4th"}
+BRACKET_SIDES = {'winners': "[W] ", 'losers': "[L] ", 'final': "[Grand Final] "}
+# Port of the / and /healthz keep-alive endpoints
+HEALTH_PORT = int(os.getenv('PORT', '8080'))
+# Log channels restored in parallel at startup
+RESTORE_CONCURRENCY = int(os.getenv('RESTORE_CONCURRENCY', '5'))
+# Callbacks blocking the event loop longer than this get their stack logged
+STALL_THRESHOLD_SECONDS = float(os.getenv('STALL_THRESHOLD_SECONDS', '0.5'))
+STALL_LOG_FILE = 'loop_stalls.log'
+PROFILE_DIR = 'profiles'  # !profile output for offline analysis
+PROFILE_MAX_SECONDS = 60
+# Workers for blocking file I/O and for CPU-heavy work on big snapshots and guilds
+OFFLOAD_IO_WORKERS = int(os.getenv('OFFLOAD_IO_WORKERS', '4'))
+OFFLOAD_CPU_WORKERS = int(os.getenv('OFFLOAD_CPU_WORKERS', '2'))
+OFFLOAD_MIN_ROWS = int(os.getenv('OFFLOAD_MIN_ROWS', '5000'))  # Smaller leaderboards render inline
+
+
+class TournamentBot(commands.Bot):
+
+    async def setup_hook(self):
+        # Runs once per process, before the gateway connects
+        storage.load()
+        load_tournaments()
+
+        # Add persistent views for buttons to work after restart
+        self.add_view(TournamentView())
+        self.add_view(TournamentConfigView(None))
+        self.add_view(HosterRegistrationView())
+
+        # Count every REST call and rate limit hit
+        instrument_http(self.http)
+        watch_rate_limits()
+
+        # Health and metrics endpoints on the bot's own event loop
+        self.health_runner = await start_keep_alive(health_status, port=HEALTH_PORT,
+                                                    metrics_text=metrics.render_prometheus)
+        self.started_at = time.time()
+
+        # Log the stack of anything blocking the loop
+        stall_detector.start()
+
+    async def invoke(self, ctx):
+        # Latency and failures of every prefix command
+        started = time.perf_counter()
+        try:
+            await super().invoke(ctx)
+        finally:
+            command = ctx.command.qualified_name if ctx.command else 'unknown'
+            metrics.observe('command_seconds', time.perf_counter() - started, command=command)
+            if ctx.command_failed:
+                metrics.inc('command_errors_total', command=command)
+
+    async def close(self):
+        # Make sure pending writes hit the disk before the loop goes away
+        stall_detector.stop()
+        await tournament_saver.flush()
+        await storage.flush()
+        offloader.shutdown(wait=False)
+        if getattr(self, 'health_runner', None):
+            await self.health_runner.cleanup()
+        await super().close()
+
+
 # Configuration and bot setup
-bot = commands.Bot(command_prefix="!", intents=discord.Intents.all())
+bot = TournamentBot(command_prefix="!", intents=discord.Intents.all())
 
 # Global data structures
-rp_data = {}
-crown_data = {}
+offloader = Offloader(io_workers=OFFLOAD_IO_WORKERS,
+                      cpu_workers=OFFLOAD_CPU_WORKERS,
+                      cpu_min_size=OFFLOAD_MIN_ROWS)
+storage = create_storage(STORAGE_BACKEND,
+                         sqlite_path=SQLITE_FILE,
+                         path=DATA_FILE,
+                         backup_path=BACKUP_FILE,
+                         journal_path=JOURNAL_FILE,
+                         debounce=SAVE_DEBOUNCE_SECONDS,
+                         compact_records=JOURNAL_COMPACT_RECORDS,
+                         compact_seconds=JOURNAL_COMPACT_SECONDS,
+                         offload=offloader,
+                         data_format=DATA_FORMAT)
 tournaments = {}
-role_permissions = {}
-bracket_roles = {}
-log_channels = {}
+startup = {
+    'restore': 'pending',  # pending -> running -> done
+    'restored': 0,
+    'failed': 0,
+    'task': None
+}
+stall_detector = StallDetector(threshold=STALL_THRESHOLD_SECONDS, path=STALL_LOG_FILE)
+profile_state = {'running': False}  # One !profile at a time, cProfile can't nest
+registration_locks = {}  # guild_id -> asyncio.Lock guarding the tournament roster
+departed_members = {}  # guild_id -> user IDs with data that are no longer in the server
+
+
+def health_status():
+    """Readiness report served on /healthz"""
+    latency = bot.latency
+    last_save = storage.last_save()
+    return {
+        'ready': bot.is_ready() and not bot.is_closed(),
+        'latency_ms': round(latency * 1000) if math.isfinite(latency) else None,
+        'loop_lag_ms': stall_detector.stats()['lag_ms'],
+        'guilds': len(bot.guilds),
+        'uptime_s': round(time.time() - bot.started_at) if hasattr(bot, 'started_at') else None,
+        'last_save': last_save,
+        'last_save_age_s': round(time.time() - last_save) if last_save else None,
+        'restore': startup['restore']
+    }
+
+
+class PlayerRef:
+    """Registered player restored from disk, stands in for the discord.Member"""
+
+    def __init__(self, user_id, name):
+        self.id = user_id
+        self.name = name
+        self.display_name = name
+
+    def __str__(self):
+        return self.name
+
 
 class Tournament:
 
     def __init__(self):
-        self.players = []
+        self.roster = {}  # Player ID -> player, in registration order
         self.max_players = 0
         self.active = False
         self.started = False
         self.current_round = 1
-        self.rounds = []
+        self.bracket = None  # Format engine producing the rounds once started
+        self.channel_id = None
+        self.message_id = None  # Message holding the tournament embed and buttons
+        self.bracket_pages = []  # [message_id, digest] of the current round's bracket messages
         self.settings = {
             "map": "Default Map",
             "abilities": "Enabled",
@@ -36,9 +199,315 @@ class Tournament:
             "rp_1st": 100,
             "rp_2nd": 50,
             "rp_3rd": 30,
-            "rp_4th": 30
+            "rp_4th": 30,
+            "seeding": "random",  # "random" or "rp"
+            "format": "single"  # Key of bracket.FORMATS
+        }
+
+    @property
+    def rounds(self):
+        return self.bracket.rounds if self.bracket else []
+
+    @property
+    def players(self):
+        """Registered players in registration order"""
+        return self.roster.values()
+
+    @property
+    def is_full(self):
+        return len(self.roster) >= self.max_players
+
+    def is_registered(self, user_id):
+        return user_id in self.roster
+
+    def add_player(self, player):
+        """Register a player, returns False if they are already in or the tournament is full"""
+        if player.id in self.roster or self.is_full:
+            return False
+        self.roster[player.id] = player
+        return True
+
+    def remove_player(self, user_id):
+        """Unregister a player, returns False if they were not registered"""
+        return self.roster.pop(user_id, None) is not None
+
+    def attach_members(self, guild):
+        """Swap restored PlayerRefs for cached members, returns how many were swapped"""
+        attached = 0
+        for user_id, player in self.roster.items():
+            if isinstance(player, PlayerRef):
+                member = guild.get_member(user_id)
+                if member is not None:
+                    self.roster[user_id] = member
+                    attached += 1
+        return attached
+
+    def player_lookup(self):
+        """Player ID -> registered player object"""
+        return self.roster
+
+    def to_record(self):
+        """Compact ID-based form of the tournament for storage"""
+        return {
+            'players': [[p.id, str(p)] for p in self.players],
+            'max_players': self.max_players,
+            'active': self.active,
+            'started': self.started,
+            'bracket': self.bracket.to_record() if self.bracket else None,
+            'settings': dict(self.settings),
+            'channel_id': self.channel_id,
+            'message_id': self.message_id,
+            'bracket_pages': self.bracket_pages
         }
 
+    @classmethod
+    def from_record(cls, record):
+        """Rebuild a tournament, players stay lightweight refs until attach_members()"""
+        tournament = cls()
+        for user_id, name in record['players']:
+            tournament.roster[user_id] = PlayerRef(user_id, name)
+
+        tournament.max_players = record['max_players']
+        tournament.active = record['active']
+        tournament.started = record['started']
+        tournament.settings.update(record['settings'])
+        if record.get('bracket'):
+            tournament.bracket = Format.from_record(record['bracket'])
+        elif record.get('rounds'):
+            # Saved before formats existed, always single elimination
+            tournament.bracket = Format.from_record({
+                'format': 'single',
+                'seeds': list(tournament.roster),
+                'seeded': tournament.settings['seeding'] == 'rp',
+                'rounds': record['rounds']
+            })
+        tournament.channel_id = record.get('channel_id')
+        tournament.message_id = record.get('message_id')
+        tournament.bracket_pages = record.get('bracket_pages', [])
+        return tournament
+
+
+def build_tournament_embed(tournament, guild_id):
+    """Registration embed with the current settings and roster"""
+    embed = discord.Embed(
+        title="<:info:1407789948219691122> Tournament Created",
+        description=
+        f"**🏆 {tournament.settings['title']}**\n\n"
+        f"**<:sgmap:1394258088575635601> Map:** {tournament.settings['map']}\n"
+        f"**⚡ Abilities:** {tournament.settings['abilities']}\n"
+        f"**👥 Max Players:** {tournament.max_players}\n"
+        f"**🎁 Prize:** {tournament.settings['prize']}\n"
+        f"**🏟️ Format:** {FORMATS[tournament.settings['format']].label}\n"
+        f"**🎯 Seeding:** {SEEDING_MODES[tournament.settings['seeding']]}\n\n"
+        f"**💰 RP Rewards:**\n"
+        f"🥇 1st Place: {tournament.settings['rp_1st']} RP + 1 Crown\n"
+        f"🥈 2nd Place: {tournament.settings['rp_2nd']} RP\n"
+        f"🥉 3rd Place: {tournament.settings['rp_3rd']} RP\n"
+        f"🏅 4th Place: {tournament.settings['rp_4th']} RP\n\n"
+        f"**Players:** {len(tournament.players)}/{tournament.max_players}",
+        color=0x00ff00)
+
+    # Add list of registered players if any, as many as fit into the embed
+    players = tournament.players
+    more = f"...and {len(players)} more. Use `!players <page>` to see everyone."
+    # Every field name and the overflow field count against the embed total too
+    budget = EMBED_TOTAL_CHARS - len(embed) - len("➕ More Players") - len(more)
+    name_size = len(f"📋 Registered Players ({len(players)}-{len(players)})")
+    chunks = []
+    current = []
+    size = 0  # Characters in the current field's value
+    used = 0  # Characters in the finished fields, names included
+    for i, player in enumerate(players):
+        line = f"{i+1}. {get_player_display_name(player, guild_id)}"[:EMBED_FIELD_CHARS]
+        if current and size + 1 + len(line) > EMBED_FIELD_CHARS:
+            chunks.append(current)
+            used += name_size + size
+            current = []
+            size = 0
+        added = len(line) + (1 if current else 0)
+        if used + name_size + size + added > budget:
+            break
+        current.append(line)
+        size += added
+    if current:
+        chunks.append(current)
+
+    listed = sum(len(chunk) for chunk in chunks)
+    shown = 0
+    for chunk in chunks:
+        name = "📋 Registered Players"
+        if len(chunks) > 1 or listed < len(players):
+            name += f" ({shown + 1}-{shown + len(chunk)})"
+        embed.add_field(name=name, value="\n".join(chunk), inline=False)
+        shown += len(chunk)
+
+    if shown < len(tournament.players):
+        embed.add_field(
+            name="➕ More Players",
+            value=f"...and {len(tournament.players) - shown} more. Use `!players <page>` to see everyone.",
+            inline=False)
+    return embed
+
+
+def render_round(round_matches, players, guild_id, show_winners=False):
+    """Bracket lines for one round, decided matches show their winner"""
+    def name(player_id):
+        return get_player_display_name(players.get(player_id, player_id), guild_id)
+
+    lines = []
+    for i, match in enumerate(round_matches.matches, 1):
+        label = f"**Match {i}:** {BRACKET_SIDES.get(match.side, '')}"
+        player1_name = name(match.player1)
+        if match.is_bye:
+            if show_winners:
+                lines.append(f"{label}{player1_name} vs BYE ✅ **Winner: {player1_name}**")
+            else:
+                lines.append(f"{label}{player1_name} vs BYE (Auto-advance) ✅")
+        elif match.winner is not None:
+            lines.append(f"{label}{player1_name} vs {name(match.player2)} ✅ **Winner: {name(match.winner)}**")
+        else:
+            lines.append(f"{label}{player1_name} vs {name(match.player2)}")
+    return lines
+
+
+def render_standings(bracket, players, guild_id, limit=10):
+    """Top of the table for points-based formats, nothing for knockouts"""
+    if not bracket.scored:
+        return []
+
+    lines = ["", "**📊 Standings**"]
+    for i, group in enumerate(bracket.standings()[:limit], 1):
+        for player_id in group:
+            name = get_player_display_name(players.get(player_id, player_id), guild_id)
+            lines.append(f"**{i}.** {name} - {bracket.score(player_id)} pts")
+    return lines
+
+
+def build_paged_embeds(title, lines, color, instructions=None):
+    """Split lines over as many embeds as needed, numbering the titles when there are several"""
+    pages = paginate_lines(lines, EMBED_PAGE_CHARS)
+    embeds = []
+    for i, page in enumerate(pages, 1):
+        page_title = title if len(pages) == 1 else f"{title} ({i}/{len(pages)})"
+        embeds.append(discord.Embed(title=page_title, description=page, color=color))
+
+    if instructions:
+        embeds[-1].add_field(name="ℹ️ Instructions",
+                             value=instructions,
+                             inline=False)
+    return embeds
+
+
+def build_bracket_embeds(tournament, guild_id):
+    """Pages showing the current round, and the results of the round before it"""
+    players = tournament.player_lookup()
+    round_num = len(tournament.rounds)
+    current_round = tournament.rounds[-1]
+
+    if round_num == 1:
+        title = "🚀 Tournament Started!"
+        lines = ["**🏆 TOURNAMENT BRACKET - Round 1**", ""]
+    else:
+        title = "🚀 Round Complete - Next Round!"
+        lines = [f"**🏆 TOURNAMENT BRACKET - Round {round_num - 1} COMPLETE!**", ""]
+        lines += render_round(tournament.rounds[-2], players, guild_id, show_winners=True)
+        lines += render_standings(tournament.bracket, players, guild_id)
+        lines += ["", f"**🔄 NEXT ROUND - Round {round_num}**", ""]
+    lines += render_round(current_round, players, guild_id)
+
+    instructions = "Moderators can use `!winner @player` to advance players to the next round."
+    return build_paged_embeds(title, lines, 0xff6b35,
+                              instructions=instructions if round_num == 1 else None)
+
+
+def embed_digest(embed):
+    fields = "\n".join(f"{field.name}:{field.value}" for field in embed.fields)
+    return hashlib.sha1(f"{embed.title}\n{embed.description}\n{fields}".encode()).hexdigest()
+
+
+async def sync_pages(channel, stored, pages, save, kind='page'):
+    """Edit page messages in place, touching only pages whose content changed
+
+    stored holds the [message_id, digest] records of the last sync, pages the new
+    (digest, embed) pairs. Pages that don't exist yet are sent and extra stored
+    pages deleted. save(records) gets the synced records, also if an edit fails midway.
+    """
+    synced = []
+    try:
+        for i, (digest, embed) in enumerate(pages):
+            if i < len(stored):
+                message_id, old_digest = stored[i]
+                if digest == old_digest:
+                    synced.append([message_id, digest])
+                    continue
+                try:
+                    await channel.get_partial_message(message_id).edit(embed=embed)
+                    synced.append([message_id, digest])
+                    continue
+                except discord.NotFound:
+                    pass  # Page was deleted, send it again
+
+            message = await channel.send(embed=embed)
+            synced.append([message.id, digest])
+
+        # Content shrank, drop the extra pages
+        for message_id, _ in stored[len(pages):]:
+            try:
+                await channel.get_partial_message(message_id).delete()
+            except discord.NotFound:
+                pass
+            except Exception as e:
+                print(f"⚠️ Could not delete {kind} {message_id}: {e}")
+    finally:
+        # If an edit failed midway, keep tracking the pages we didn't get to
+        if len(synced) < len(pages):
+            synced += stored[len(synced):]
+        save(synced)
+    return synced
+
+
+@metrics.timed('task_seconds', task='sync_bracket_pages')
+async def sync_bracket_pages(tournament, channel, embeds):
+    """Edit the current round's bracket messages in place, sending pages that don't exist yet"""
+    def save(synced):
+        tournament.bracket_pages = synced
+        if synced:
+            tournament.message_id = synced[0][0]
+
+    await sync_pages(channel, [list(page) for page in tournament.bracket_pages],
+                     [(embed_digest(embed), embed) for embed in embeds], save,
+                     kind='bracket page')
+
+
+def seed_players(tournament, guild_id):
+    """Player IDs ordered by the guild's RP/crown standings, best first"""
+    return sorted((player.id for player in tournament.players),
+                  key=lambda user_id: (-storage.get_rp(guild_id, user_id),
+                                       -storage.get_crowns(guild_id, user_id),
+                                       user_id))
+
+
+def start_bracket(tournament, guild_id):
+    """Start the tournament with a seeded or shuffled Round 1"""
+    tournament.started = True
+    tournament.active = True
+
+    # Create bracket pairs for Round 1
+    seeded = tournament.settings['seeding'] == 'rp'
+    if seeded:
+        player_ids = seed_players(tournament, guild_id)
+    else:
+        player_ids = [player.id for player in tournament.players]
+        random.shuffle(player_ids)
+    tournament.bracket = FORMATS[tournament.settings['format']](player_ids, seeded=seeded)
+    tournament.bracket.start()
+    tournament.bracket_pages = []
+
+
+def get_registration_lock(guild_id):
+    """Lock serializing roster changes of one guild's tournament"""
+    return registration_locks.setdefault(guild_id, asyncio.Lock())
+
 
 def get_tournament(guild_id):
     """Get tournament for specific guild"""
@@ -47,30 +516,43 @@ def get_tournament(guild_id):
     return tournaments[guild_id]
 
 
+def save_tournament(guild_id):
+    """Persist the guild's tournament after a state transition"""
+    storage.save_tournament(guild_id, get_tournament(guild_id).to_record())
+
+
 def reset_tournament(guild_id):
     """Reset tournament for specific guild"""
     tournaments[guild_id] = Tournament()
+    storage.delete_tournament(guild_id)
+
+
+def load_tournaments():
+    """Rehydrate tournaments that were running before a restart"""
+    for guild_id, record in storage.load_tournaments().items():
+        try:
+            # Runs before the gateway fills the guild cache, on_ready attaches the members
+            tournaments[guild_id] = Tournament.from_record(record)
+        except Exception as e:
+            print(f"⚠️ Could not restore tournament for guild {guild_id}: {e}")
+    if tournaments:
+        print(f"✅ Restored {len(tournaments)} tournament(s)")
 
 
-def add_bracket_role(guild_id, user_id, emoji):
+async def add_bracket_role(guild_id, user_id, emoji):
     """Add bracket role emoji to user"""
-    guild_str = str(guild_id)
-    user_str = str(user_id)
-    
-    if guild_str not in bracket_roles:
-        bracket_roles[guild_str] = {}
-    
-    if user_str not in bracket_roles[guild_str]:
-        bracket_roles[guild_str][user_str] = []
-    
-    if emoji not in bracket_roles[guild_str][user_str]:
-        bracket_roles[guild_str][user_str].append(emoji)
+    await state.submit(guild_id, [(user_id, 'brkt_add', emoji)])
+
+
+async def remove_bracket_role(guild_id, user_id, emoji=None):
+    """Remove one bracket emoji (or all of them when emoji is None) from user"""
+    await state.submit(guild_id, [(user_id, 'brkt_rmv', emoji)])
 
 
 def get_player_display_name(player, guild_id=None):
     """Get player display name with bracket emojis"""
     if isinstance(player, FakePlayer):
-        return player.user.name
+        return player.name
 
     # Get base name (Priority: nick > display_name > name > str(player))
     if hasattr(player, 'user.name') and player.user.name:
@@ -83,392 +565,297 @@ def get_player_display_name(player, guild_id=None):
         base_name = str(player)
 
     # Add bracket emojis if they exist
-    if guild_id and str(guild_id) in bracket_roles:
-        user_id = str(player.id) if hasattr(player, 'id') else str(player)
-        if user_id in bracket_roles[str(guild_id)]:
-            emojis = ''.join(bracket_roles[str(guild_id)][user_id])
-            return f"{base_name} {emojis}"
+    if guild_id and hasattr(player, 'id'):
+        user_brackets = storage.get_brackets(guild_id, player.id)
+        if user_brackets:
+            return f"{base_name} {''.join(user_brackets)}"
 
     return base_name
 
 
-def load_data():
-    global rp_data, crown_data, role_permissions, bracket_roles, log_channels
-    try:
-        with open('user_data.json', 'r') as f:
-            data = json.load(f)
-            # Support both old TP data and new RP data for migration
-            rp_data = data.get('rp_data', data.get('tp_data', {}))
-            crown_data = data.get('crown_data', {})
-            role_permissions = data.get('role_permissions', {})
-            bracket_roles = data.get('bracket_roles', {})
-            log_channels = data.get('log_channels', {})
-            print("✅ Data loaded successfully")
-    except FileNotFoundError:
-        print("📂 No data file found, starting fresh")
-        rp_data = {}
-        crown_data = {}
-        role_permissions = {}
-        bracket_roles = {}
-        log_channels = {}
-    except Exception as e:
-        print(f"⚠️ Error loading data: {e}")
-        rp_data = {}
-        crown_data = {}
-        role_permissions = {}
-        bracket_roles = {}
-        log_channels = {}
+# Score changes go through the guild's state actor, which also schedules the leaderboard refresh
 
+async def add_rp(guild_id, user_id, rp):
+    await state.submit(guild_id, [(user_id, 'rp', rp)])
 
-def save_data():
-    try:
-        data = {
-            'rp_data': rp_data,
-            'crown_data': crown_data,
-            'role_permissions': role_permissions,
-            'bracket_roles': bracket_roles,
-            'log_channels': log_channels
-        }
-        
-        # Create backup
-        try:
-            with open('user_data_backup.json', 'w') as f:
-                json.dump(data, f, indent=2)
-        except:
-            pass
-        
-        # Save main file
-        with open('user_data.json', 'w') as f:
-            json.dump(data, f, indent=2)
-    except Exception as e:
-        print(f"⚠️ Error saving data: {e}")
+async def add_crown(guild_id, user_id, crowns=1):
+    await state.submit(guild_id, [(user_id, 'crown', crowns)])
 
+async def apply_rewards(guild_id, changes):
+    """Apply many (user_id, kind, value) reward changes with one write and one leaderboard refresh"""
+    await state.submit(guild_id, changes)
 
-def add_rp(guild_id, user_id, rp):
-    guild_str = str(guild_id)
-    user_str = str(user_id)
+async def award_placements(guild_id, bracket, settings):
+    """Pay out RP, crowns and medals for the top places of a finished bracket in one batch"""
+    changes = []
+    # One player per paid place, however many share a standings group
+    for place, user_id in bracket.placements()[:len(PLACEMENT_REWARDS)]:
+        rp_key, crowns, emoji = PLACEMENT_REWARDS[place]
+        changes.append((user_id, 'rp', settings[rp_key]))
+        if crowns:
+            changes.append((user_id, 'crown', crowns))
+        if emoji:
+            changes.append((user_id, 'brkt_add', emoji))
+    await apply_rewards(guild_id, changes)
+
+def is_leaderboard_message(message):
+    if message.author != bot.user or not message.embeds:
+        return False
+    embed = message.embeds[0]
+    return bool(embed.title and "Server Leaderboard" in embed.title and embed.description)
 
-    if guild_str not in rp_data:
-        rp_data[guild_str] = {}
 
-    if user_str not in rp_data[guild_str]:
-        rp_data[guild_str][user_str] = 0
+async def fetch_leaderboard_messages(channel, limit=50):
+    """Messages making up the latest leaderboard in a channel"""
+    # Known page IDs make this exact
+    messages = []
+    for message_id, _ in storage.get_leaderboard_pages(channel.guild.id):
+        try:
+            messages.append(await channel.fetch_message(message_id))
+        except discord.NotFound:
+            pass
+    if messages:
+        return [m for m in messages if is_leaderboard_message(m)]
 
-    rp_data[guild_str][user_str] += rp
-    save_data()
-    
-    # Auto-update leaderboard
-    asyncio.create_task(log_reward_update(guild_id, user_id, rp, 0))
+    # Otherwise walk back until the first page of the newest leaderboard
+    async for message in channel.history(limit=limit):
+        if is_leaderboard_message(message):
+            messages.append(message)
+            if "(Page" not in message.embeds[0].title:
+                break
+    return messages
 
-def add_crown(guild_id, user_id, crowns=1):
-    guild_str = str(guild_id)
-    user_str = str(user_id)
 
-    if guild_str not in crown_data:
-        crown_data[guild_str] = {}
+def build_member_name_index(guild):
+    """name / display name / decorated name -> member, built once per restore"""
+    index = {}
+    for member in guild.members:
+        index.setdefault(member.name, member)
+        index.setdefault(member.display_name, member)
 
-    if user_str not in crown_data[guild_str]:
-        crown_data[guild_str][user_str] = 0
+    # Decorated names only differ for members with bracket emojis
+    for user_id, _, _, user_brackets in storage.guild_entries(guild.id):
+        if user_brackets:
+            member = guild.get_member(user_id)
+            if member is not None:
+                index.setdefault(get_player_display_name(member, guild.id), member)
+    return index
 
-    crown_data[guild_str][user_str] += crowns
-    save_data()
-    
-    # Auto-update leaderboard
-    asyncio.create_task(log_reward_update(guild_id, user_id, 0, crowns))
 
+@metrics.timed('task_seconds', task='parse_leaderboard_data')
 async def parse_leaderboard_data(channel, limit=50):
     """Parse previous leaderboard messages to restore RP/Crown/bracket data"""
-    global rp_data, crown_data, bracket_roles
-    
     if not isinstance(channel, discord.TextChannel):
         return False
-    
+
     try:
-        # Look for recent bot messages with leaderboard data
-        async for message in channel.history(limit=limit):
-            if message.author == bot.user and message.embeds:
-                embed = message.embeds[0]
-                if "Server Leaderboard" in embed.title and embed.description:
-                    guild_str = str(channel.guild.id)
-                    
-                    # Initialize data structures if not exist
-                    if guild_str not in rp_data:
-                        rp_data[guild_str] = {}
-                    if guild_str not in crown_data:
-                        crown_data[guild_str] = {}
-                    if guild_str not in bracket_roles:
-                        bracket_roles[guild_str] = {}
-                    
-                    # Parse each line in the description
-                    lines = embed.description.split('\n')
-                    for line in lines:
-                        if '<:Ranked:' in line:
-                            # Extract user data from line format: "1. Username - 100<:Ranked:...> 5<:Crown:...> ⏱️ 🥇"
-                            try:
-                                # Remove ranking emoji and get the rest
-                                if '.' in line:
-                                    parts = line.split('.', 1)
-                                    if len(parts) > 1:
-                                        content = parts[1].strip()
-                                    else:
-                                        content = line
-                                else:
-                                    content = line
-                                
-                                # Extract username (before " - ")
-                                if ' - ' in content:
-                                    username_part = content.split(' - ')[0].strip()
-                                    data_part = content.split(' - ')[1]
-                                    
-                                    # Find member by username
-                                    member = None
-                                    for m in channel.guild.members:
-                                        if (m.name == username_part or 
-                                            m.display_name == username_part or
-                                            get_player_display_name(m, channel.guild.id) == username_part):
-                                            member = m
-                                            break
-                                    
-                                    if member:
-                                        user_str = str(member.id)
-                                        
-                                        # Extract RP
-                                        if '<:Ranked:' in data_part:
-                                            rp_match = data_part.split('<:Ranked:')[0].strip()
-                                            try:
-                                                rp_value = int(rp_match.split()[-1])
-                                                rp_data[guild_str][user_str] = max(rp_value, rp_data[guild_str].get(user_str, 0))
-                                            except:
-                                                pass
-                                        
-                                        # Extract crowns
-                                        if '<:Crown:' in data_part:
-                                            crown_parts = data_part.split('<:Crown:')
-                                            if len(crown_parts) > 1:
-                                                crown_match = crown_parts[0].split()[-1]
-                                                try:
-                                                    crown_value = int(crown_match)
-                                                    crown_data[guild_str][user_str] = max(crown_value, crown_data[guild_str].get(user_str, 0))
-                                                except:
-                                                    pass
-                                        
-                                        # Extract bracket emojis
-                                        if '⏱️' in data_part:
-                                            emoji_part = data_part.split('⏱️')[1].strip()
-                                            if emoji_part and user_str not in bracket_roles[guild_str]:
-                                                bracket_roles[guild_str][user_str] = list(emoji_part.split())
-                                        
-                                        # Check for medal emojis in username
-                                        for emoji in ['🥇', '🥈', '🥉']:
-                                            if emoji in username_part:
-                                                if user_str not in bracket_roles[guild_str]:
-                                                    bracket_roles[guild_str][user_str] = []
-                                                if emoji not in bracket_roles[guild_str][user_str]:
-                                                    bracket_roles[guild_str][user_str].append(emoji)
-                                        
-                            except Exception as e:
-                                print(f"Error parsing line: {line}, Error: {e}")
-                                continue
-                    
-                    # Save the restored data
-                    save_data()
-                    print(f"✅ Restored data from previous leaderboard message")
-                    return True
-                    
+        messages = await fetch_leaderboard_messages(channel, limit)
+        if not messages:
+            return False
+
+        guild_id = channel.guild.id
+        pages = [(message.embeds[0].description,
+                  message.embeds[0].footer.text if message.embeds[0].footer else None)
+                 for message in messages]
+        # Parsing thousands of lines moves to a worker process
+        parsed = await offloader.cpu(parse_leaderboard_pages, pages,
+                                     size=sum(description.count("\n") + 1
+                                              for description, _ in pages))
+
+        name_index = None
+        restored = []
+        for rows, user_ids in parsed:
+            # Pages carry the user ID of every line in the footer
+            if user_ids is None:
+                # Older leaderboard without IDs, fall back to name matching
+                if name_index is None:
+                    name_index = build_member_name_index(channel.guild)
+                user_ids = [getattr(name_index.get(row[0]), 'id', None) for row in rows]
+
+            for (name, rp_value, crown_value, brackets), user_id in zip(rows, user_ids):
+                if user_id is not None:
+                    restored.append((name, user_id, rp_value, crown_value, brackets))
+
+        def restore_entries():
+            # Runs on the guild's state actor, so live rewards can't interleave with the merge
+            return storage.restore_entries(
+                guild_id, [(user_id, rp_value, crown_value, brackets)
+                           for _, user_id, rp_value, crown_value, brackets in restored])
+
+        merged = await state.run(guild_id, restore_entries)
+
+        print(f"✅ Restored data from previous leaderboard message ({merged} entries changed)")
+        return True
+
     except Exception as e:
         print(f"Error parsing leaderboard data: {e}")
-    
+
     return False
 
 
+async def resolve_members(guild, user_ids):
+    """Map user IDs to members, using the cache first and batched gateway queries for the rest"""
+    members = {}
+    missing = []
+    departed = departed_members.setdefault(guild.id, set())
+    for user_id in user_ids:
+        member = guild.get_member(user_id)
+        if member is not None:
+            members[user_id] = member
+        elif user_id not in departed:
+            missing.append(user_id)
+
+    # query_members accepts at most 100 IDs per request
+    for i in range(0, len(missing), 100):
+        batch = missing[i:i + 100]
+        try:
+            found = await guild.query_members(user_ids=batch, cache=True)
+        except Exception as e:
+            print(f"⚠️ Could not query members for guild {guild.id}: {e}")
+            break
+        for member in found:
+            members[member.id] = member
+        # Whoever didn't come back has left the server, don't ask again
+        departed.update(set(batch) - {member.id for member in found})
+
+    return members
+
+
+@metrics.timed('task_seconds', task='update_log_embed')
 async def update_log_embed(guild_id, channel):
     """Update or create log embed with current RP and crown leaderboard for ALL server members"""
-    guild_str = str(guild_id)
-    guild_rp_data = rp_data.get(guild_str, {})
-    guild_crown_data = crown_data.get(guild_str, {})
-    
-    # Initialize leaderboard_text early to avoid UnboundLocalError
-    leaderboard_text = ""
-    
-    # Get ALL server members, not just those with RP/crowns
     guild = bot.get_guild(guild_id)
     if not guild:
         return
-    
-    # Ensure member cache is populated
-    try:
-        await guild.chunk(cache=True)
-    except Exception:
-        pass  # Fallback if chunk fails
-        
-    combined_data = []
-    for member in guild.members:
-        # Skip bots
-        if member.bot:
+
+    # Drive from the data side: only members with RP/crowns/brackets get resolved
+    entries = storage.guild_entries(guild_id)
+    members = await resolve_members(guild, [entry[0] for entry in entries])
+
+    # Entries come from the ranking index already sorted by RP, then crowns
+    rows = []
+    for user_id, rp, crowns, user_brackets in entries:
+        member = members.get(user_id)
+        # Skip bots and users who left the server
+        if member is None or member.bot:
             continue
-            
-        user_id = str(member.id)
-        rp = guild_rp_data.get(user_id, 0)
-        crowns = guild_crown_data.get(user_id, 0)
-        
-        # Get bracket roles for this member
-        user_brackets = []
-        if guild_str in bracket_roles and user_id in bracket_roles[guild_str]:
-            user_brackets = bracket_roles[guild_str][user_id]
-        
-        # Only include members who have RP, crowns, or bracket roles
-        if rp > 0 or crowns > 0 or user_brackets:
-            combined_data.append((user_id, rp, crowns, member))
-    
-    # Sort by RP (highest first), then by crowns, then by display name
-    combined_data.sort(key=lambda x: (x[1], x[2], x[3].display_name.lower()), reverse=True)
-    
-    # Create embed
-    embed = discord.Embed(
-        title="🏆 Server Leaderboard", 
-        color=0xffd700,
-        timestamp=datetime.now()
-    )
-    
-    if not combined_data:
-        embed.description = "No members with RP, Crowns, or Bracket roles found."
-    else:
-        for i, (user_id, rp, crowns, member) in enumerate(combined_data, 1):  # Show ALL members
-            # Add ranking emojis (only gold/silver/bronze for those with RP > 0)
-            if i == 1 and rp > 0:
-                emoji = "🥇"
-            elif i == 2 and rp > 0:
-                emoji = "🥈"
-            elif i == 3 and rp > 0:
-                emoji = "🥉"
-            else:
-                emoji = f"**{i}.**"
-            
-            # Use get_player_display_name for consistent naming
-            display_name = get_player_display_name(member, guild_id)
-            line = f"{emoji} {display_name} - {rp}<:Ranked:1411317994847473695>"
-            if crowns > 0:
-                line += f" {crowns}<:Crown:1394255336310968434>"
-            
-            # Add bracket role if exists (already included in get_player_display_name but kept for clarity)
-            if guild_str in bracket_roles and user_id in bracket_roles[guild_str]:
-                emojis = ''.join(bracket_roles[guild_str][user_id])
-                if emojis not in line:  # Avoid duplication
-                    line += f" ⏱️ {emojis}"
-            
-            leaderboard_text += line + "\n"
-        
-        # Handle Discord's embed character limit (4096 characters)
-        if len(leaderboard_text) > 4000:
-            # Split into multiple embeds if too long
-            lines = leaderboard_text.strip().split("\n")
-            chunks = []
-            current_chunk = ""
-            
-            for line in lines:
-                if len(current_chunk + line + "\n") > 4000:
-                    chunks.append(current_chunk.strip())
-                    current_chunk = line + "\n"
-                else:
-                    current_chunk += line + "\n"
-            
-            if current_chunk.strip():
-                chunks.append(current_chunk.strip())
-            
-            # Set first chunk as main embed
-            embed.description = chunks[0]
-        else:
-            embed.description = leaderboard_text
-    
-    embed.set_footer(text="Last updated")
-    
-    # Try to edit the last embed, or send a new one
-    try:
-        async for message in channel.history(limit=1):
-            if message.author == bot.user and message.embeds:
-                await message.edit(embed=embed)
-                
-                # Send additional embeds if needed for long leaderboards
-                if len(leaderboard_text) > 4000:
-                    lines = leaderboard_text.strip().split("\n")
-                    chunks = []
-                    current_chunk = ""
-                    
-                    for line in lines:
-                        if len(current_chunk + line + "\n") > 4000:
-                            chunks.append(current_chunk.strip())
-                            current_chunk = line + "\n"
-                        else:
-                            current_chunk += line + "\n"
-                    
-                    if current_chunk.strip():
-                        chunks.append(current_chunk.strip())
-                    
-                    # Send additional pages if needed
-                    for i, chunk in enumerate(chunks[1:], 2):
-                        additional_embed = discord.Embed(
-                            title=f"🏆 Server Leaderboard (Page {i})",
-                            description=chunk,
-                            color=0xffd700,
-                            timestamp=datetime.now()
-                        )
-                        additional_embed.set_footer(text="Last updated")
-                        await channel.send(embed=additional_embed)
-                return
-    except:
-        pass
-    
-    # Send new embed if editing failed
-    new_message = await channel.send(embed=embed)
-    
-    # Send additional embeds if needed for long leaderboards
-    if len(leaderboard_text) > 4000:
-        lines = leaderboard_text.strip().split("\n")
-        chunks = []
-        current_chunk = ""
-        
-        for line in lines:
-            if len(current_chunk + line + "\n") > 4000:
-                chunks.append(current_chunk.strip())
-                current_chunk = line + "\n"
-            else:
-                current_chunk += line + "\n"
-        
-        if current_chunk.strip():
-            chunks.append(current_chunk.strip())
-        
-        # Send additional pages
-        for i, chunk in enumerate(chunks[1:], 2):
-            additional_embed = discord.Embed(
-                title=f"🏆 Server Leaderboard (Page {i})",
-                description=chunk,
-                color=0xffd700,
-                timestamp=datetime.now()
-            )
-            additional_embed.set_footer(text="Last updated")
-            await channel.send(embed=additional_embed)
-
-async def log_reward_update(guild_id, user_id, rp_gained=0, crowns_gained=0):
-    """Log when a player gains RP or crowns"""
-    guild_str = str(guild_id)
-    if guild_str in log_channels:
-        channel_id = log_channels[guild_str]
+        # Same as get_player_display_name, reusing the brackets we already have
+        display_name = f"{member} {''.join(user_brackets)}" if user_brackets else str(member)
+        rows.append((user_id, display_name, rp, crowns, list(user_brackets or ())))
+
+    # Rendering every line of a huge guild moves to a worker process
+    pages = await offloader.cpu(render_leaderboard_pages, rows, EMBED_PAGE_CHARS,
+                                EMBED_FOOTER_CHARS, EMBED_TOTAL_CHARS, size=len(rows))
+
+    await sync_leaderboard_pages(guild_id, channel, pages)
+
+
+def build_leaderboard_page(title, description, footer):
+    embed = discord.Embed(title=title,
+                          description=description,
+                          color=0xffd700,
+                          timestamp=datetime.now())
+    embed.set_footer(text=footer)
+    return embed
+
+
+@metrics.timed('task_seconds', task='sync_leaderboard_pages')
+async def sync_leaderboard_pages(guild_id, channel, pages):
+    """Edit leaderboard page messages in place, touching only pages whose content changed"""
+    stored = [list(page) for page in storage.get_leaderboard_pages(guild_id)]
+    original = [list(page) for page in stored]
+
+    # Adopt the pre-existing single message from before page IDs were tracked
+    if not stored:
+        try:
+            async for message in channel.history(limit=1):
+                if message.author == bot.user and message.embeds:
+                    stored = [[message.id, None]]
+        except Exception:
+            pass
+
+    def save(synced):
+        if synced != original:
+            storage.set_leaderboard_pages(guild_id, synced)
+
+    pages = [(hashlib.sha1(f"{title}\n{description}\n{footer}".encode()).hexdigest(),
+              build_leaderboard_page(title, description, footer))
+             for title, description, footer in pages]
+    await sync_pages(channel, stored, pages, save, kind='leaderboard page')
+
+
+async def refresh_leaderboard(guild_id):
+    """Rebuild the leaderboard in the guild's log channel"""
+    channel_id = storage.get_log_channel(guild_id)
+    if channel_id:
         channel = bot.get_channel(channel_id)
         if channel:
             await update_log_embed(guild_id, channel)
 
 
+leaderboard_refresher = CoalescingScheduler(refresh_leaderboard,
+                                            interval=LEADERBOARD_REFRESH_SECONDS,
+                                            delay=LEADERBOARD_REFRESH_DELAY)
+
+
+@metrics.timed('task_seconds', task='refresh_tournament_embed')
+async def refresh_tournament_embed(guild_id):
+    """Bring the guild's tournament messages up to date: registration embed or bracket pages"""
+    tournament = tournaments.get(guild_id)
+    if not tournament or not tournament.channel_id:
+        return
+
+    channel = bot.get_channel(tournament.channel_id)
+    if not channel:
+        return
+
+    if tournament.started:
+        if tournament.rounds:
+            await sync_bracket_pages(tournament, channel,
+                                     build_bracket_embeds(tournament, guild_id))
+            save_tournament(guild_id)
+        return
+
+    if not tournament.message_id:
+        return
+    embed = build_tournament_embed(tournament, guild_id)
+    # Leaving out view keeps the registration buttons attached
+    await channel.get_partial_message(tournament.message_id).edit(embed=embed)
+
+
+tournament_renderer = CoalescingScheduler(refresh_tournament_embed,
+                                          interval=TOURNAMENT_RENDER_SECONDS,
+                                          delay=TOURNAMENT_RENDER_DELAY)
+
+
+async def save_roster(guild_id):
+    """Deferred save after registration clicks, skipped if the tournament was reset meanwhile"""
+    tournament = tournaments.get(guild_id)
+    if tournament is not None and tournament.active:
+        save_tournament(guild_id)
+
+
+# Each save encodes the whole roster, so a burst of clicks shares one
+tournament_saver = CoalescingScheduler(save_roster,
+                                       interval=TOURNAMENT_SAVE_SECONDS,
+                                       delay=TOURNAMENT_SAVE_DELAY)
+
+
+def log_reward_update(guild_id):
+    """Schedule a leaderboard refresh, bursts of rewards collapse into one rebuild"""
+    leaderboard_refresher.request(guild_id)
+
+
+state = GuildStateActor(storage, on_change=log_reward_update)
+
+
 def has_permission(user, guild_id, permission_type):
     """Check if user has specific permission type"""
-    guild_str = str(guild_id)
-    if guild_str not in role_permissions:
-        return False
-
-    if permission_type not in role_permissions[guild_str]:
+    allowed_role_ids = storage.get_roles(guild_id, permission_type)
+    if not allowed_role_ids:
         return False
 
     user_role_ids = [role.id for role in getattr(user, 'roles', [])]
-    allowed_role_ids = role_permissions[guild_str][permission_type]
 
     return any(role_id in allowed_role_ids for role_id in user_role_ids)
 
@@ -476,25 +863,54 @@ def has_permission(user, guild_id, permission_type):
 @bot.event
 async def on_ready():
     print(f"✅ Bot is online as {bot.user}")
-    load_data()
+    print("🔧 Bot is ready and all systems operational!")
 
-    # Add persistent views for buttons to work after restart
-    bot.add_view(TournamentView())
-    bot.add_view(TournamentConfigView(None))
-    bot.add_view(HosterRegistrationView())
+    # Tournaments restored in setup_hook only had PlayerRefs, the member cache is filled now
+    for guild_id, tournament in tournaments.items():
+        guild = bot.get_guild(guild_id)
+        if guild is not None:
+            tournament.attach_members(guild)
 
-    print("🔧 Bot is ready and all systems operational!")
-    
-    # Auto-restore data from existing log channels
-    for guild_str, channel_id in log_channels.items():
+    # on_ready fires again on every reconnect, restore only once per process
+    if startup['task'] is None:
+        startup['task'] = asyncio.create_task(restore_log_channels())
+
+
+@metrics.timed('task_seconds', task='restore_log_channel')
+async def restore_log_channel(semaphore, guild_id, channel_id):
+    async with semaphore:
         try:
             channel = bot.get_channel(channel_id)
             if isinstance(channel, discord.TextChannel):
                 restored = await parse_leaderboard_data(channel)
                 if restored:
-                    print(f"✅ Auto-restored data for guild {guild_str} from {channel.name}")
+                    startup['restored'] += 1
+                    print(f"✅ Auto-restored data for guild {guild_id} from {channel.name}")
         except Exception as e:
-            print(f"⚠️ Could not restore data for guild {guild_str}: {e}")
+            startup['failed'] += 1
+            print(f"⚠️ Could not restore data for guild {guild_id}: {e}")
+
+
+async def restore_log_channels():
+    """Auto-restore data from existing log channels in the background"""
+    startup['restore'] = 'running'
+    started = time.monotonic()
+    semaphore = asyncio.Semaphore(RESTORE_CONCURRENCY)
+
+    log_channels = storage.log_channels()
+    await asyncio.gather(*(restore_log_channel(semaphore, guild_id, channel_id)
+                           for guild_id, channel_id in log_channels.items()))
+
+    startup['restore'] = 'done'
+    print(f"✅ Startup restore finished: {startup['restored']} restored, "
+          f"{startup['failed']} failed, {len(log_channels)} log channels "
+          f"in {time.monotonic() - started:.1f}s")
+
+
+@bot.event
+async def on_member_join(member):
+    # Rejoining members show up on the leaderboard again
+    departed_members.get(member.guild.id, set()).discard(member.id)
 
 
 class TournamentConfigModal(discord.ui.Modal,
@@ -513,7 +929,7 @@ class TournamentConfigModal(discord.ui.Modal,
         label="👥 Max Players",
         placeholder="Enter max players (e.g., 16)...",
         default="",
-        max_length=3)
+        max_length=4)
 
     map_field = discord.ui.TextInput(label="🗺️ Tournament Map",
                                      placeholder="Enter map name...",
@@ -531,12 +947,14 @@ class TournamentConfigModal(discord.ui.Modal,
                                        default="",
                                        max_length=100)
 
+    @metrics.timed('interaction_seconds', callback='configure_submit')
     async def on_submit(self, interaction: discord.Interaction):
         try:
             max_players = int(self.max_players_field.value)
-            if max_players < 2 or max_players > 64:
+            if max_players < 2 or max_players > MAX_TOURNAMENT_PLAYERS:
                 await interaction.response.send_message(
-                    "❌ Max players must be between 2 and 64!", ephemeral=True)
+                    f"❌ Max players must be between 2 and {MAX_TOURNAMENT_PLAYERS}!",
+                    ephemeral=True)
                 return
 
             tournament = get_tournament(interaction.guild.id)
@@ -548,26 +966,16 @@ class TournamentConfigModal(discord.ui.Modal,
                 "prize": self.prize_field.value
             })
 
-            embed = discord.Embed(
-                title="<:info:1407789948219691122> Tournament Created",
-                description=
-                f"**🏆 {tournament.settings['title']}**\n\n"
-                f"**<:sgmap:1394258088575635601> Map:** {tournament.settings['map']}\n"
-                f"**⚡ Abilities:** {tournament.settings['abilities']}\n"
-                f"**👥 Max Players:** {tournament.max_players}\n"
-                f"**🎁 Prize:** {tournament.settings['prize']}\n\n"
-                f"**💰 RP Rewards:**\n"
-                f"🥇 1st Place: {tournament.settings['rp_1st']} RP + 1 Crown\n"
-                f"🥈 2nd Place: {tournament.settings['rp_2nd']} RP\n"
-                f"🥉 3rd Place: {tournament.settings['rp_3rd']} RP\n"
-                f"🏅 4th Place: {tournament.settings['rp_4th']} RP\n\n"
-                f"**Players:** 0/{tournament.max_players}",
-                color=0x00ff00)
+            embed = build_tournament_embed(tournament, interaction.guild.id)
 
             # Add tournament management view
             view = TournamentView()
             await interaction.response.edit_message(embed=embed, view=view)
 
+            tournament.channel_id = interaction.channel_id
+            tournament.message_id = interaction.message.id if interaction.message else None
+            save_tournament(interaction.guild.id)
+
         except ValueError:
             await interaction.response.send_message(
                 "❌ Max players must be a valid number!", ephemeral=True)
@@ -585,6 +993,7 @@ class TournamentConfigView(discord.ui.View):
     @discord.ui.button(label="⚙️ Configure Tournament",
                        style=discord.ButtonStyle.primary,
                        custom_id="configure_tournament")
+    @metrics.timed('interaction_seconds', callback='configure_tournament')
     async def configure_tournament(self, interaction: discord.Interaction,
                                    button: discord.ui.Button):
         if not has_permission(interaction.user, interaction.guild.id,
@@ -600,6 +1009,7 @@ class TournamentConfigView(discord.ui.View):
     @discord.ui.button(label="❌ Cancel",
                        style=discord.ButtonStyle.secondary,
                        custom_id="cancel_config")
+    @metrics.timed('interaction_seconds', callback='cancel_config')
     async def cancel_config(self, interaction: discord.Interaction,
                             button: discord.ui.Button):
         await interaction.response.edit_message(
@@ -618,64 +1028,36 @@ class TournamentView(discord.ui.View):
     @discord.ui.button(label="✅ Register",
                        style=discord.ButtonStyle.success,
                        custom_id="register_tournament")
+    @metrics.timed('interaction_seconds', callback='register')
     async def register(self, interaction: discord.Interaction,
                        button: discord.ui.Button):
         try:
             tournament = get_tournament(interaction.guild.id)
 
-            if tournament.started:
-                await interaction.response.send_message(
-                    "❌ Tournament has already started!", ephemeral=True)
-                return
+            async with get_registration_lock(interaction.guild.id):
+                if tournament.started:
+                    await interaction.response.send_message(
+                        "❌ Tournament has already started!", ephemeral=True)
+                    return
 
-            if len(tournament.players) >= tournament.max_players:
-                await interaction.response.send_message(
-                    "❌ Tournament is full!", ephemeral=True)
-                return
+                if tournament.is_registered(interaction.user.id):
+                    await interaction.response.send_message(
+                        "❌ You are already registered!", ephemeral=True)
+                    return
 
-            user_already_registered = any(
-                player and hasattr(player, 'id') and player.id == interaction.user.id 
-                for player in tournament.players)
+                if not tournament.add_player(interaction.user):
+                    await interaction.response.send_message(
+                        "❌ Tournament is full!", ephemeral=True)
+                    return
 
-            if user_already_registered:
-                await interaction.response.send_message(
-                    "❌ You are already registered!", ephemeral=True)
-                return
-
-            tournament.players.append(interaction.user)
+                tournament_saver.request(interaction.guild.id)
 
             # Updated registration confirmation with simple format
             await interaction.response.send_message(
                 "Successfully registered! ✅", ephemeral=True)
 
-            # Update main embed with new player count
-            embed = discord.Embed(
-                title="<:info:1407789948219691122> Tournament Created",
-                description=
-                f"**🏆 {tournament.settings['title']}**\n\n"
-                f"**<:sgmap:1394258088575635601> Map:** {tournament.settings['map']}\n"
-                f"**⚡ Abilities:** {tournament.settings['abilities']}\n"
-                f"**👥 Max Players:** {tournament.max_players}\n"
-                f"**🎁 Prize:** {tournament.settings['prize']}\n\n"
-                f"**💰 RP Rewards:**\n"
-                f"🥇 1st Place: {tournament.settings['rp_1st']} RP + 1 Crown\n"
-                f"🥈 2nd Place: {tournament.settings['rp_2nd']} RP\n"
-                f"🥉 3rd Place: {tournament.settings['rp_3rd']} RP\n"
-                f"🏅 4th Place: {tournament.settings['rp_4th']} RP\n\n"
-                f"**Players:** {len(tournament.players)}/{tournament.max_players}",
-                color=0x00ff00)
-
-            # Add list of registered players if any
-            if tournament.players:
-                player_list = "\n".join([
-                    f"{i+1}. {get_player_display_name(player, interaction.guild.id)}"
-                    for i, player in enumerate(tournament.players)
-                ])
-                embed.add_field(name="📋 Registered Players",
-                                value=player_list,
-                                inline=False)
-
-            await interaction.edit_original_response(embed=embed, view=self)
+            # The public embed catches up once per render window
+            tournament_renderer.request(interaction.guild.id)
 
         except Exception as e:
             await interaction.response.send_message(
@@ -684,60 +1066,31 @@ class TournamentView(discord.ui.View):
     @discord.ui.button(label="❌ Unregister",
                        style=discord.ButtonStyle.danger,
                        custom_id="unregister_tournament")
+    @metrics.timed('interaction_seconds', callback='unregister')
     async def unregister(self, interaction: discord.Interaction,
                          button: discord.ui.Button):
         try:
             tournament = get_tournament(interaction.guild.id)
 
-            if tournament.started:
-                await interaction.response.send_message(
-                    "❌ Cannot unregister after tournament has started!",
-                    ephemeral=True)
-                return
+            async with get_registration_lock(interaction.guild.id):
+                if tournament.started:
+                    await interaction.response.send_message(
+                        "❌ Cannot unregister after tournament has started!",
+                        ephemeral=True)
+                    return
 
-            user_registered = False
-            for i, player in enumerate(tournament.players):
-                if player and hasattr(player, 'id') and player.id == interaction.user.id:
-                    tournament.players.pop(i)
-                    user_registered = True
-                    break
+                if not tournament.remove_player(interaction.user.id):
+                    await interaction.response.send_message(
+                        "❌ You are not registered!", ephemeral=True)
+                    return
 
-            if not user_registered:
-                await interaction.response.send_message(
-                    "❌ You are not registered!", ephemeral=True)
-                return
+                tournament_saver.request(interaction.guild.id)
 
             await interaction.response.send_message(
                 "Successfully unregistered! ❌", ephemeral=True)
 
-            # Update main embed
-            embed = discord.Embed(
-                title="<:info:1407789948219691122> Tournament Created",
-                description=
-                f"**🏆 {tournament.settings['title']}**\n\n"
-                f"**<:sgmap:1394258088575635601> Map:** {tournament.settings['map']}\n"
-                f"**⚡ Abilities:** {tournament.settings['abilities']}\n"
-                f"**👥 Max Players:** {tournament.max_players}\n"
-                f"**🎁 Prize:** {tournament.settings['prize']}\n\n"
-                f"**💰 RP Rewards:**\n"
-                f"🥇 1st Place: {tournament.settings['rp_1st']} RP + 1 Crown\n"
-                f"🥈 2nd Place: {tournament.settings['rp_2nd']} RP\n"
-                f"🥉 3rd Place: {tournament.settings['rp_3rd']} RP\n"
-                f"🏅 4th Place: {tournament.settings['rp_4th']} RP\n\n"
-                f"**Players:** {len(tournament.players)}/{tournament.max_players}",
-                color=0x00ff00)
-
-            # Add list of registered players if any
-            if tournament.players:
-                player_list = "\n".join([
-                    f"{i+1}. {get_player_display_name(player, interaction.guild.id)}"
-                    for i, player in enumerate(tournament.players)
-                ])
-                embed.add_field(name="📋 Registered Players",
-                                value=player_list,
-                                inline=False)
-
-            await interaction.edit_original_response(embed=embed, view=self)
+            # The public embed catches up once per render window
+            tournament_renderer.request(interaction.guild.id)
 
         except Exception as e:
             await interaction.response.send_message(
@@ -746,6 +1099,7 @@ class TournamentView(discord.ui.View):
     @discord.ui.button(label="🚀 Start Tournament",
                        style=discord.ButtonStyle.primary,
                        custom_id="start_tournament")
+    @metrics.timed('interaction_seconds', callback='start_tournament')
     async def start_tournament(self, interaction: discord.Interaction,
                                button: discord.ui.Button):
         if not has_permission(interaction.user, interaction.guild.id,
@@ -757,62 +1111,91 @@ class TournamentView(discord.ui.View):
 
         tournament = get_tournament(interaction.guild.id)
 
-        if tournament.started:
+        async with get_registration_lock(interaction.guild.id):
+            if tournament.started:
+                await interaction.response.send_message(
+                    "❌ Tournament has already started!", ephemeral=True)
+                return
+
+            if len(tournament.players) < 2:
+                await interaction.response.send_message(
+                    "❌ Need at least 2 players to start!", ephemeral=True)
+                return
+
+            start_bracket(tournament, interaction.guild.id)
+
+        # The registration message becomes the first bracket page, later pages follow it
+        embeds = build_bracket_embeds(tournament, interaction.guild.id)
+        await interaction.response.edit_message(embed=embeds[0], view=None)
+
+        tournament.channel_id = interaction.channel_id
+        if interaction.message:
+            tournament.bracket_pages = [[interaction.message.id, embed_digest(embeds[0])]]
+        save_tournament(interaction.guild.id)
+        await tournament_renderer.run_now(interaction.guild.id)
+
+    @discord.ui.button(label="🎯 Toggle Seeding",
+                       style=discord.ButtonStyle.secondary,
+                       custom_id="toggle_seeding")
+    @metrics.timed('interaction_seconds', callback='toggle_seeding')
+    async def toggle_seeding(self, interaction: discord.Interaction,
+                             button: discord.ui.Button):
+        if not has_permission(interaction.user, interaction.guild.id,
+                              'tournament_host'):
             await interaction.response.send_message(
-                "❌ Tournament has already started!", ephemeral=True)
+                "❌ You don't have permission to manage tournaments!",
+                ephemeral=True)
             return
 
-        if len(tournament.players) < 2:
+        tournament = get_tournament(interaction.guild.id)
+
+        async with get_registration_lock(interaction.guild.id):
+            if tournament.started:
+                await interaction.response.send_message(
+                    "❌ Tournament has already started!", ephemeral=True)
+                return
+
+            seeding = 'random' if tournament.settings['seeding'] == 'rp' else 'rp'
+            tournament.settings['seeding'] = seeding
+            save_tournament(interaction.guild.id)
+
+        await interaction.response.edit_message(
+            embed=build_tournament_embed(tournament, interaction.guild.id))
+
+    @discord.ui.button(label="🏟️ Change Format",
+                       style=discord.ButtonStyle.secondary,
+                       custom_id="change_format")
+    @metrics.timed('interaction_seconds', callback='change_format')
+    async def change_format(self, interaction: discord.Interaction,
+                            button: discord.ui.Button):
+        if not has_permission(interaction.user, interaction.guild.id,
+                              'tournament_host'):
             await interaction.response.send_message(
-                "❌ Need at least 2 players to start!", ephemeral=True)
+                "❌ You don't have permission to manage tournaments!",
+                ephemeral=True)
             return
 
-        tournament.started = True
-        tournament.active = True
-
-        # Create bracket pairs for Round 1
-        players = tournament.players.copy()
-        random.shuffle(players)
-
-        round_1_matches = []
-        while len(players) >= 2:
-            player1 = players.pop(0)
-            player2 = players.pop(0)
-            round_1_matches.append([player1, player2])
-
-        # Handle odd player (bye)
-        if players:
-            bye_player = players[0]
-            round_1_matches.append([bye_player, "BYE"])
-
-        tournament.rounds = [round_1_matches]
-
-        # Create bracket display
-        bracket_text = "**🏆 TOURNAMENT BRACKET - Round 1**\n\n"
-        for i, match in enumerate(round_1_matches, 1):
-            player1_name = get_player_display_name(match[0],
-                                                   interaction.guild.id)
-            if match[1] == "BYE":
-                bracket_text += f"**Match {i}:** {player1_name} vs BYE (Auto-advance) ✅\n"
-            else:
-                player2_name = get_player_display_name(match[1],
-                                                       interaction.guild.id)
-                bracket_text += f"**Match {i}:** {player1_name} vs {player2_name}\n"
+        tournament = get_tournament(interaction.guild.id)
 
-        embed = discord.Embed(title="🚀 Tournament Started!",
-                              description=bracket_text,
-                              color=0xff6b35)
-        embed.add_field(
-            name="ℹ️ Instructions",
-            value=
-            "Moderators can use `!winner @player` to advance players to the next round.",
-            inline=False)
+        async with get_registration_lock(interaction.guild.id):
+            if tournament.started:
+                await interaction.response.send_message(
+                    "❌ Tournament has already started!", ephemeral=True)
+                return
+
+            # Cycle through the available formats
+            names = list(FORMATS)
+            current = names.index(tournament.settings['format'])
+            tournament.settings['format'] = names[(current + 1) % len(names)]
+            save_tournament(interaction.guild.id)
 
-        await interaction.response.edit_message(embed=embed, view=None)
+        await interaction.response.edit_message(
+            embed=build_tournament_embed(tournament, interaction.guild.id))
 
     @discord.ui.button(label="🗑️ Delete Tournament",
                        style=discord.ButtonStyle.danger,
                        custom_id="delete_tournament")
+    @metrics.timed('interaction_seconds', callback='delete_tournament')
     async def delete_tournament(self, interaction: discord.Interaction,
                                 button: discord.ui.Button):
         if not has_permission(interaction.user, interaction.guild.id,
@@ -841,6 +1224,7 @@ class HosterRegistrationView(discord.ui.View):
     @discord.ui.button(label="✅ Register as Hoster",
                        style=discord.ButtonStyle.success,
                        custom_id="register_hoster")
+    @metrics.timed('interaction_seconds', callback='register_hoster')
     async def register_hoster(self, interaction: discord.Interaction,
                               button: discord.ui.Button):
         try:
@@ -853,16 +1237,14 @@ class HosterRegistrationView(discord.ui.View):
                 return
 
             # Check if user has any of the allowed roles for tournament hosting
-            guild_str = str(interaction.guild.id)
-            if (guild_str not in role_permissions
-                    or 'tournament_host' not in role_permissions[guild_str]):
+            allowed_role_ids = storage.get_roles(interaction.guild.id, 'tournament_host')
+            if not allowed_role_ids:
                 await interaction.response.send_message(
                     "❌ No hoster roles have been configured for this server! Ask an admin to set them up with `!htr @role`.",
                     ephemeral=True)
                 return
 
             user_role_ids = [role.id for role in getattr(interaction.user, 'roles', [])]
-            allowed_role_ids = role_permissions[guild_str]['tournament_host']
 
             if not any(role_id in allowed_role_ids
                        for role_id in user_role_ids):
@@ -883,6 +1265,7 @@ class HosterRegistrationView(discord.ui.View):
     @discord.ui.button(label="❌ Unregister",
                        style=discord.ButtonStyle.danger,
                        custom_id="unregister_hoster")
+    @metrics.timed('interaction_seconds', callback='unregister_hoster')
     async def unregister_hoster(self, interaction: discord.Interaction,
                                 button: discord.ui.Button):
         try:
@@ -905,18 +1288,17 @@ class HosterRegistrationView(discord.ui.View):
     @discord.ui.button(label="ℹ️ View Requirements",
                        style=discord.ButtonStyle.secondary,
                        custom_id="view_requirements")
+    @metrics.timed('interaction_seconds', callback='view_requirements')
     async def view_requirements(self, interaction: discord.Interaction,
                                 button: discord.ui.Button):
         try:
-            guild_str = str(interaction.guild.id)
-            if (guild_str not in role_permissions
-                    or 'tournament_host' not in role_permissions[guild_str]):
+            allowed_role_ids = storage.get_roles(interaction.guild.id, 'tournament_host')
+            if not allowed_role_ids:
                 await interaction.response.send_message(
                     "❌ No hoster requirements have been configured for this server!",
                     ephemeral=True)
                 return
 
-            allowed_role_ids = role_permissions[guild_str]['tournament_host']
             role_names = []
 
             for role_id in allowed_role_ids:
@@ -998,46 +1380,15 @@ async def start(ctx):
         await ctx.send("❌ Need at least 2 players to start!", delete_after=5)
         return
 
-    tournament.started = True
-    tournament.active = True
-
-    # Create bracket pairs for Round 1
-    players = tournament.players.copy()
-    random.shuffle(players)
-
-    round_1_matches = []
-    while len(players) >= 2:
-        player1 = players.pop(0)
-        player2 = players.pop(0)
-        round_1_matches.append([player1, player2])
-
-    # Handle odd player (bye)
-    if players:
-        bye_player = players[0]
-        round_1_matches.append([bye_player, "BYE"])
-
-    tournament.rounds = [round_1_matches]
-
-    # Create bracket display
-    bracket_text = "**🏆 TOURNAMENT BRACKET - Round 1**\n\n"
-    for i, match in enumerate(round_1_matches, 1):
-        player1_name = get_player_display_name(match[0], ctx.guild.id)
-        if match[1] == "BYE":
-            bracket_text += f"**Match {i}:** {player1_name} vs BYE (Auto-advance) ✅\n"
-        else:
-            player2_name = get_player_display_name(match[1], ctx.guild.id)
-            bracket_text += f"**Match {i}:** {player1_name} vs {player2_name}\n"
-
-    embed = discord.Embed(title="🚀 Tournament Started!",
-                          description=bracket_text,
-                          color=0xff6b35)
-    embed.add_field(
-        name="ℹ️ Instructions",
-        value=
-        "Moderators can use `!winner @player` to advance players to the next round.",
-        inline=False)
+    async with get_registration_lock(ctx.guild.id):
+        # A concurrent start may have won the race while we were checking
+        if tournament.started:
+            return
+        start_bracket(tournament, ctx.guild.id)
 
-    await ctx.send(embed=embed)
+    tournament.channel_id = ctx.channel.id
+    save_tournament(ctx.guild.id)
+    await tournament_renderer.run_now(ctx.guild.id)
 
 
 @bot.command(name="winner")
@@ -1064,128 +1415,56 @@ async def winner(ctx, member: discord.Member):
         return
 
     current_round = tournament.rounds[-1]
-    winner_found = False
 
     # Find the match with this player and mark them as winner
-    for match in current_round:
-        if match[1] == "BYE":
-            continue
-
-        if ((hasattr(match[0], 'id') and match[0] and match[0].id == member.id) or 
-            (hasattr(match[1], 'id') and match[1] and match[1].id == member.id)):
-            # Mark the winner
-            if hasattr(match[0], 'id') and match[0] and match[0].id == member.id:
-                match.append(match[0])  # Winner is player 1
-                winner_found = True
-            elif hasattr(match[1], 'id') and match[1] and match[1].id == member.id:
-                match.append(match[1])  # Winner is player 2
-                winner_found = True
-            break
-
-    if not winner_found:
+    if current_round.record_winner(member.id) is None:
         await ctx.send("❌ Player not found in current round!", delete_after=5)
         return
 
-    # Check if all matches in current round are complete
-    all_matches_complete = True
-    winners = []
-
-    for match in current_round:
-        if match[1] == "BYE":
-            winners.append(match[0])  # Bye player auto-advances
-        elif len(match) >= 3:  # Match has a winner
-            winners.append(match[2])
-        else:
-            all_matches_complete = False
-
-    if all_matches_complete:
-        # Create bracket display with winners marked
-        round_num = len(tournament.rounds)
-        bracket_text = f"**🏆 TOURNAMENT BRACKET - Round {round_num} COMPLETE!**\n\n"
-
-        for i, match in enumerate(current_round, 1):
-            player1_name = get_player_display_name(match[0], ctx.guild.id)
-            if match[1] == "BYE":
-                bracket_text += f"**Match {i}:** {player1_name} vs BYE ✅ **Winner: {player1_name}**\n"
-            else:
-                player2_name = get_player_display_name(match[1], ctx.guild.id)
-                if len(match) >= 3:
-                    winner_name = get_player_display_name(match[2], ctx.guild.id)
-                    bracket_text += f"**Match {i}:** {player1_name} vs {player2_name} ✅ **Winner: {winner_name}**\n"
+    if current_round.complete:
+        players = tournament.player_lookup()
 
-        if len(winners) == 1:
+        if tournament.bracket.advance() is None:
             # Tournament is complete!
-            final_winner = winners[0]
-            winner_name = get_player_display_name(final_winner, ctx.guild.id)
-
-            # Award RP and crowns
-            add_rp(ctx.guild.id, final_winner.id, tournament.settings['rp_1st'])
-            add_crown(ctx.guild.id, final_winner.id, 1)
-            add_bracket_role(ctx.guild.id, final_winner.id, "🥇")
-
-            # Award other places if we can determine them
-            if len(tournament.rounds) >= 2:
-                # Find runner-up (loser of final)
-                final_match = current_round[0]
-                if len(final_match) >= 3 and final_match[2] and final_match[1]:
-                    runner_up = final_match[0] if (final_match[2] and final_match[1] and final_match[2].id == final_match[1].id) else final_match[1]
-                    add_rp(ctx.guild.id, runner_up.id,
-                           tournament.settings['rp_2nd'])
-                    add_bracket_role(ctx.guild.id, runner_up.id, "🥈")
-
-            bracket_text += f"\n🎉 **TOURNAMENT COMPLETE!**\n🏆 **CHAMPION: {winner_name}**"
-
-            embed = discord.Embed(title="🏆 Tournament Complete!",
-                                  description=bracket_text,
-                                  color=0xffd700)
-
-            # Reset tournament
+            final_winner = tournament.bracket.standings()[0][0]
+            winner_name = get_player_display_name(players[final_winner], ctx.guild.id)
+
+            # Create bracket display with winners marked
+            round_num = len(tournament.rounds)
+            lines = [f"**🏆 TOURNAMENT BRACKET - Round {round_num} COMPLETE!**", ""]
+            lines += render_round(current_round, players, ctx.guild.id,
+                                  show_winners=True)
+            lines += render_standings(tournament.bracket, players, ctx.guild.id)
+            lines += ["", "🎉 **TOURNAMENT COMPLETE!**", f"🏆 **CHAMPION: {winner_name}**"]
+            for place, player_id in tournament.bracket.placements()[1:len(PLACEMENT_REWARDS)]:
+                medal = PLACEMENT_REWARDS[place][2] or "🏅"
+                name = get_player_display_name(players[player_id], ctx.guild.id)
+                lines.append(f"{medal} **{ORDINALS[place]} Place:** {name}")
+
+            # Reset tournament before awaiting anything, so a second !winner can't finish it again
             reset_tournament(ctx.guild.id)
 
-            # Log the reward update
-            await log_reward_update(ctx.guild.id, final_winner.id,
-                                    tournament.settings['rp_1st'], 1)
-
-        elif len(winners) >= 2:
-            # Create next round
-            next_round_matches = []
-            round_winners = winners.copy()
-            random.shuffle(round_winners)
-
-            while len(round_winners) >= 2:
-                player1 = round_winners.pop(0)
-                player2 = round_winners.pop(0)
-                next_round_matches.append([player1, player2])
-
-            # Handle odd player (bye to next round)
-            if round_winners:
-                bye_player = round_winners[0]
-                next_round_matches.append([bye_player, "BYE"])
-
-            tournament.rounds.append(next_round_matches)
-
-            # Display current round complete + next round
-            next_round_num = len(tournament.rounds)
-            bracket_text += f"\n\n**🔄 NEXT ROUND - Round {next_round_num}**\n\n"
-
-            for i, match in enumerate(next_round_matches, 1):
-                player1_name = get_player_display_name(match[0], ctx.guild.id)
-                if match[1] == "BYE":
-                    bracket_text += f"**Match {i}:** {player1_name} vs BYE (Auto-advance) ✅\n"
-                else:
-                    player2_name = get_player_display_name(match[1],
-                                                           ctx.guild.id)
-                    bracket_text += f"**Match {i}:** {player1_name} vs {player2_name}\n"
-
-            embed = discord.Embed(title="🚀 Round Complete - Next Round!",
-                                  description=bracket_text,
-                                  color=0xff6b35)
-
-        await ctx.send(embed=embed)
+            # Award RP, crowns and medals for every paid place at once
+            await award_placements(ctx.guild.id, tournament.bracket, tournament.settings)
+
+            for embed in build_paged_embeds("🏆 Tournament Complete!", lines, 0xffd700):
+                await ctx.send(embed=embed)
+
+        else:
+            # The format built the next round, its bracket goes out as a fresh set of pages
+            tournament.bracket_pages = []
+            tournament.channel_id = tournament.channel_id or ctx.channel.id
+            save_tournament(ctx.guild.id)
+            await tournament_renderer.run_now(ctx.guild.id)
     else:
-        # Just announce this match winner
+        # Just announce this match winner, the bracket page catches up in place
         winner_name = get_player_display_name(member, ctx.guild.id)
         await ctx.send(f"✅ **{winner_name}** wins their match! 🎉")
+        tournament_renderer.request(ctx.guild.id)
+
+    # Finished tournaments were already reset (and deleted from storage)
+    if tournaments.get(ctx.guild.id) is tournament:
+        save_tournament(ctx.guild.id)
 
 
 # Fake Player class for testing
@@ -1197,6 +1476,9 @@ class FakePlayer:
         self.nick = name
         self.id = user_id
 
+    def __str__(self):
+        return self.name
+
 
 @bot.command(name="add_fake_player")
 async def add_fake_player(ctx, name: str):
@@ -1218,46 +1500,73 @@ async def add_fake_player(ctx, name: str):
                        delete_after=5)
         return
 
-    if len(tournament.players) >= tournament.max_players:
-        await ctx.send("❌ Tournament is full!", delete_after=5)
-        return
-
     # Create fake player with unique ID
     fake_id = hash(name) % 1000000  # Simple hash for unique ID
     fake_player = FakePlayer(name, fake_id)
-    tournament.players.append(fake_player)
 
+    async with get_registration_lock(ctx.guild.id):
+        if tournament.is_full:
+            await ctx.send("❌ Tournament is full!", delete_after=5)
+            return
+
+        if not tournament.add_player(fake_player):
+            await ctx.send("❌ A player with that name is already registered!",
+                           delete_after=5)
+            return
+
+        tournament_saver.request(ctx.guild.id)
+
+    tournament_renderer.request(ctx.guild.id)
     await ctx.send(f"✅ Added fake player: **{name}**", delete_after=3)
 
 
+@bot.command(name="players")
+@commands.guild_only()
+async def list_players(ctx, page: int = 1):
+    try:
+        await ctx.message.delete()
+    except:
+        pass
+
+    tournament = get_tournament(ctx.guild.id)
+    if not tournament.players:
+        await ctx.send("❌ No players registered!", delete_after=5)
+        return
+
+    total_pages = (len(tournament.players) + ROSTER_PAGE_SIZE - 1) // ROSTER_PAGE_SIZE
+    page = min(max(page, 1), total_pages)
+    offset = (page - 1) * ROSTER_PAGE_SIZE
+    roster = islice(tournament.players, offset, offset + ROSTER_PAGE_SIZE)
+
+    player_list = "\n".join(
+        f"{i}. {get_player_display_name(player, ctx.guild.id)}"
+        for i, player in enumerate(roster, offset + 1))
+
+    embed = discord.Embed(title=f"📋 Registered Players ({len(tournament.players)}/{tournament.max_players})",
+                          description=player_list[:EMBED_PAGE_CHARS],
+                          color=0x00ff00)
+    embed.set_footer(text=f"Page {page}/{total_pages}")
+    await ctx.send(embed=embed)
+
+
 # RP and Crown Commands
 
 @bot.command(name="rp_lb")
-async def rp_lb(ctx):
+async def rp_lb(ctx, page: int = 1):
     try:
         await ctx.message.delete()
     except:
         pass
 
-    guild_str = str(ctx.guild.id)
-    guild_rp_data = rp_data.get(guild_str, {})
-    guild_crown_data = crown_data.get(guild_str, {})
-
-    if not guild_rp_data and not guild_crown_data:
+    if not storage.has_scores(ctx.guild.id):
         await ctx.send("No RP or crown data found for this server!",
                        delete_after=5)
         return
 
-    # Combine and sort players by RP
-    combined_data = []
-    for user_id in set(list(guild_rp_data.keys()) +
-                       list(guild_crown_data.keys())):
-        rp = guild_rp_data.get(user_id, 0)
-        crowns = guild_crown_data.get(user_id, 0)
-        if rp > 0 or crowns > 0:
-            combined_data.append((user_id, rp, crowns))
-
-    combined_data.sort(key=lambda x: x[1], reverse=True)  # Sort by RP
+    # One page of players by RP, straight from the ranking index
+    page = max(page, 1)
+    offset = (page - 1) * 10
+    combined_data = storage.top(ctx.guild.id, by='rp', limit=10, offset=offset)
 
     if not combined_data:
         await ctx.send("No players with RP or crowns found!", delete_after=5)
@@ -1265,8 +1574,8 @@ async def rp_lb(ctx):
 
     # Create leaderboard
     leaderboard_text = ""
-    for i, (user_id, rp, crowns) in enumerate(combined_data[:10], 1):
-        user = ctx.guild.get_member(int(user_id))
+    for i, (user_id, rp, crowns) in enumerate(combined_data, offset + 1):
+        user = ctx.guild.get_member(user_id)
         if user:
             # Add ranking emojis
             if i == 1:
@@ -1286,9 +1595,36 @@ async def rp_lb(ctx):
     embed = discord.Embed(title="🏆 RP Leaderboard",
                           description=leaderboard_text,
                           color=0xffd700)
+    if page > 1:
+        embed.set_footer(text=f"Page {page}")
     await ctx.send(embed=embed)
 
 
+@bot.command(name="rank")
+@commands.guild_only()
+async def rank(ctx, member: discord.Member = None):
+    try:
+        await ctx.message.delete()
+    except:
+        pass
+
+    member = member or ctx.author
+    position = storage.rank(ctx.guild.id, member.id)
+    name = get_player_display_name(member, ctx.guild.id)
+
+    if position is None:
+        await ctx.send(f"❌ {name} is not on the leaderboard yet!", delete_after=5)
+        return
+
+    place, total = position
+    rp = storage.get_rp(ctx.guild.id, member.id)
+    crowns = storage.get_crowns(ctx.guild.id, member.id)
+    line = f"🏅 **{name}** is ranked **#{place}** of {total} - {rp}<:Ranked:1411317994847473695>"
+    if crowns > 0:
+        line += f" {crowns}<:Crown:1394255336310968434>"
+    await ctx.send(line)
+
+
 @bot.command(name="rp_rst")
 async def rp_rst(ctx):
     try:
@@ -1300,15 +1636,7 @@ async def rp_rst(ctx):
         await ctx.send("❌ You don't have admin permissions!", delete_after=5)
         return
 
-    guild_str = str(ctx.guild.id)
-    if guild_str in rp_data:
-        rp_data[guild_str] = {}
-    if guild_str in crown_data:
-        crown_data[guild_str] = {}
-    if guild_str in bracket_roles:
-        bracket_roles[guild_str] = {}
-
-    save_data()
+    await state.run(ctx.guild.id, storage.reset_guild, ctx.guild.id)
     await ctx.send("✅ All RP, crowns, and bracket roles have been reset!",
                    delete_after=5)
 
@@ -1324,14 +1652,11 @@ async def rp_add(ctx, member: discord.Member, amount: int = 1):
         await ctx.send("❌ You don't have admin permissions!", delete_after=5)
         return
 
-    add_rp(ctx.guild.id, member.id, amount)
+    await add_rp(ctx.guild.id, member.id, amount)
     await ctx.send(
         f"✅ Added {amount} RP to {get_player_display_name(member, ctx.guild.id)}!",
         delete_after=5)
 
-    # Log the reward update
-    await log_reward_update(ctx.guild.id, member.id, amount, 0)
-
 
 @bot.command(name="rp_rmv")
 async def rp_rmv(ctx, member: discord.Member, amount: int = 1):
@@ -1344,14 +1669,11 @@ async def rp_rmv(ctx, member: discord.Member, amount: int = 1):
         await ctx.send("❌ You don't have admin permissions!", delete_after=5)
         return
 
-    add_rp(ctx.guild.id, member.id, -amount)
+    await add_rp(ctx.guild.id, member.id, -amount)
     await ctx.send(
         f"✅ Removed {amount} RP from {get_player_display_name(member, ctx.guild.id)}!",
         delete_after=5)
 
-    # Log the reward update
-    await log_reward_update(ctx.guild.id, member.id, -amount, 0)
-
 
 @bot.command(name="crwn_add")
 async def crwn_add(ctx, member: discord.Member, amount: int = 1):
@@ -1364,14 +1686,11 @@ async def crwn_add(ctx, member: discord.Member, amount: int = 1):
         await ctx.send("❌ You don't have admin permissions!", delete_after=5)
         return
 
-    add_crown(ctx.guild.id, member.id, amount)
+    await add_crown(ctx.guild.id, member.id, amount)
     await ctx.send(
         f"✅ Added {amount} crown(s) to {get_player_display_name(member, ctx.guild.id)}!",
         delete_after=5)
 
-    # Log the reward update
-    await log_reward_update(ctx.guild.id, member.id, 0, amount)
-
 
 @bot.command(name="crwn_rmv")
 async def crwn_rmv(ctx, member: discord.Member, amount: int = 1):
@@ -1384,14 +1703,11 @@ async def crwn_rmv(ctx, member: discord.Member, amount: int = 1):
         await ctx.send("❌ You don't have admin permissions!", delete_after=5)
         return
 
-    add_crown(ctx.guild.id, member.id, -amount)
+    await add_crown(ctx.guild.id, member.id, -amount)
     await ctx.send(
         f"✅ Removed {amount} crown(s) from {get_player_display_name(member, ctx.guild.id)}!",
         delete_after=5)
 
-    # Log the reward update
-    await log_reward_update(ctx.guild.id, member.id, 0, -amount)
-
 
 @bot.command(name="crowns")
 async def crowns(ctx):
@@ -1400,22 +1716,17 @@ async def crowns(ctx):
     except:
         pass
 
-    guild_str = str(ctx.guild.id)
-    guild_crown_data = crown_data.get(guild_str, {})
+    # Top players by crowns
+    sorted_players = storage.top(ctx.guild.id, by='crowns', limit=10)
 
-    if not guild_crown_data:
+    if not sorted_players:
         await ctx.send("No crown data found for this server!", delete_after=5)
         return
 
-    # Sort players by crowns
-    sorted_players = sorted(guild_crown_data.items(),
-                            key=lambda x: x[1],
-                            reverse=True)
-
     # Create leaderboard
     leaderboard_text = ""
-    for i, (user_id, crowns) in enumerate(sorted_players[:10], 1):
-        user = ctx.guild.get_member(int(user_id))
+    for i, (user_id, rp, crowns) in enumerate(sorted_players, 1):
+        user = ctx.guild.get_member(user_id)
         if user and crowns > 0:
             # Add ranking emojis
             if i == 1:
@@ -1450,15 +1761,11 @@ async def brkt_add(ctx, member: discord.Member, emoji: str):
         await ctx.send("❌ You don't have admin permissions!", delete_after=5)
         return
 
-    add_bracket_role(ctx.guild.id, member.id, emoji)
-    save_data()
+    await add_bracket_role(ctx.guild.id, member.id, emoji)
     await ctx.send(
         f"✅ Added bracket emoji {emoji} to {get_player_display_name(member, ctx.guild.id)}!",
         delete_after=5)
 
-    # Log the reward update
-    await log_reward_update(ctx.guild.id, member.id, 0, 0)
-
 
 @bot.command(name="brkt_rmv")
 async def brkt_rmv(ctx, member: discord.Member, emoji: str = None):
@@ -1471,17 +1778,13 @@ async def brkt_rmv(ctx, member: discord.Member, emoji: str = None):
         await ctx.send("❌ You don't have admin permissions!", delete_after=5)
         return
 
-    guild_str = str(ctx.guild.id)
-    user_str = str(member.id)
-    
-    if guild_str in bracket_roles and user_str in bracket_roles[guild_str]:
+    user_brackets = storage.get_brackets(ctx.guild.id, member.id)
+
+    if user_brackets:
         if emoji:
             # Remove specific emoji
-            if emoji in bracket_roles[guild_str][user_str]:
-                bracket_roles[guild_str][user_str].remove(emoji)
-                if not bracket_roles[guild_str][user_str]:  # Remove empty list
-                    del bracket_roles[guild_str][user_str]
-                save_data()
+            if emoji in user_brackets:
+                await remove_bracket_role(ctx.guild.id, member.id, emoji)
                 await ctx.send(
                     f"✅ Removed bracket emoji {emoji} from {get_player_display_name(member, ctx.guild.id)}!",
                     delete_after=5)
@@ -1489,18 +1792,174 @@ async def brkt_rmv(ctx, member: discord.Member, emoji: str = None):
                 await ctx.send(f"❌ {get_player_display_name(member, ctx.guild.id)} doesn't have emoji {emoji}!", delete_after=5)
         else:
             # Remove all bracket emojis
-            del bracket_roles[guild_str][user_str]
-            save_data()
+            await remove_bracket_role(ctx.guild.id, member.id)
             await ctx.send(
                 f"✅ Removed all bracket emojis from {get_player_display_name(member, ctx.guild.id)}!",
                 delete_after=5)
-        
-        # Log the reward update
-        await log_reward_update(ctx.guild.id, member.id, 0, 0)
     else:
         await ctx.send(f"❌ {get_player_display_name(member, ctx.guild.id)} has no bracket emojis!", delete_after=5)
 
 
+@bot.command(name="bulk")
+@commands.guild_only()
+async def bulk(ctx, *, text: str = ""):
+    # One `<op> <@user> [value]` per line after the command, and/or CSV attachments
+    try:
+        await ctx.message.delete()
+    except:
+        pass
+
+    if not has_permission(ctx.author, ctx.guild.id, 'admin'):
+        await ctx.send("❌ You don't have admin permissions!", delete_after=5)
+        return
+
+    rows = text_rows(text)
+    for attachment in ctx.message.attachments:
+        if attachment.size > BULK_MAX_FILE_BYTES:
+            await ctx.send(f"❌ {attachment.filename} is too large!", delete_after=5)
+            return
+        try:
+            rows += csv_rows(await attachment.read(), attachment.filename)
+        except UnicodeDecodeError:
+            await ctx.send(f"❌ {attachment.filename} is not a UTF-8 CSV file!", delete_after=5)
+            return
+
+    changes, errors = parse_reward_lines(rows)
+    if not changes and not errors:
+        await ctx.send(
+            "❌ Nothing to apply! Use one `rp_add|rp_rmv|crwn_add|crwn_rmv|brkt_add|brkt_rmv @user [value]` "
+            "per line, or attach a CSV with op,user,value rows.",
+            delete_after=10)
+        return
+
+    if len(changes) > BULK_MAX_CHANGES:
+        await ctx.send(f"❌ Too many changes ({len(changes)}), the limit is {BULK_MAX_CHANGES}!",
+                       delete_after=5)
+        return
+
+    # One write and one leaderboard refresh for the whole batch
+    if changes:
+        await apply_rewards(ctx.guild.id, changes)
+
+    players = len({user_id for user_id, _, _ in changes})
+    report = f"✅ Applied {len(changes)} change(s) for {players} player(s)!"
+    if errors:
+        report += f"\n⚠️ Skipped {len(errors)} line(s):\n"
+        report += "\n".join(f"Line {line_no}: {message}" for line_no, message in errors[:10])
+        if len(errors) > 10:
+            report += f"\n...and {len(errors) - 10} more"
+    await ctx.send(report[:2000])
+
+
+@bot.command(name="stats")
+@commands.guild_only()
+async def stats(ctx):
+    try:
+        await ctx.message.delete()
+    except:
+        pass
+
+    if not has_permission(ctx.author, ctx.guild.id, 'admin'):
+        await ctx.send("❌ You don't have admin permissions!", delete_after=5)
+        return
+
+    def latency_lines(name, label, limit=8):
+        lines = []
+        for labels, count, mean, p50, p95 in metrics.summary(name)[:limit]:
+            lines.append(f"`{labels.get(label, '-')}` {count}x avg {mean * 1000:.0f}ms "
+                         f"p50≤{p50 * 1000:.0f}ms p95≤{p95 * 1000:.0f}ms")
+        return "\n".join(lines) or "No data yet"
+
+    embed = discord.Embed(title="📈 Bot Stats", color=0x3498db)
+    embed.add_field(name="⌨️ Commands", value=latency_lines('command_seconds', 'command'), inline=False)
+    embed.add_field(name="🖱️ Interactions", value=latency_lines('interaction_seconds', 'callback'), inline=False)
+    embed.add_field(name="⚙️ Background Tasks", value=latency_lines('task_seconds', 'task'), inline=False)
+
+    refresher = leaderboard_refresher.stats()
+    actor = state.stats()
+    embed.add_field(
+        name="🌐 Discord API",
+        value=f"{metrics.counter_total('discord_api_calls_total')} calls, "
+              f"{metrics.counter_total('discord_api_errors_total')} errors, "
+              f"{metrics.counter_total('discord_rate_limits_total')} rate limits\n"
+              f"Gateway latency: {bot.latency * 1000:.0f}ms, "
+              f"event loop lag: {stall_detector.stats()['lag_ms']}ms",
+        inline=False)
+    embed.add_field(
+        name="💾 State",
+        value=f"Leaderboard refreshes: {refresher['runs']} for {refresher['requests']} requests\n"
+              f"Reward batches: {actor['writes']} writes for {actor['submitted']} changes\n"
+              f"Journal records: {metrics.counter_total('journal_records_total')}",
+        inline=False)
+    embed.add_field(
+        name="❗ Errors",
+        value=f"Commands: {metrics.counter_total('command_errors_total')}, "
+              f"interactions: {metrics.counter_total('interaction_seconds_errors_total')}, "
+              f"tasks: {metrics.counter_total('task_seconds_errors_total')}",
+        inline=False)
+    await ctx.send(embed=embed)
+
+
+@bot.command(name="profile")
+@commands.guild_only()
+async def profile(ctx, seconds: int = 10, mode: str = "cprofile"):
+    try:
+        await ctx.message.delete()
+    except:
+        pass
+
+    if not has_permission(ctx.author, ctx.guild.id, 'admin'):
+        await ctx.send("❌ You don't have admin permissions!", delete_after=5)
+        return
+
+    mode = mode.lower()
+    if mode not in ('cprofile', 'sample'):
+        await ctx.send("❌ Mode must be `cprofile` or `sample`!", delete_after=5)
+        return
+
+    if profile_state['running']:
+        await ctx.send("❌ A profile is already being captured!", delete_after=5)
+        return
+
+    seconds = max(1, min(seconds, PROFILE_MAX_SECONDS))
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+
+    profile_state['running'] = True
+    notice = await ctx.send(f"🔬 Profiling the event loop for {seconds}s ({mode})...")
+    try:
+        if mode == 'cprofile':
+            path = os.path.join(PROFILE_DIR, f"profile-{stamp}.prof")
+            rows = await profile_loop(seconds, path)
+            lines = [f"`{label}` {calls}x own {own * 1000:.0f}ms cum {cumulative * 1000:.0f}ms"
+                     for calls, own, cumulative, label in rows]
+            heading = "⏱️ Top Functions by Own Time"
+        else:
+            path = os.path.join(PROFILE_DIR, f"profile-{stamp}.folded")
+            total, leaves = await sample_loop(seconds, path)
+            lines = [f"`{label}` {count / total:.0%}" for label, count in leaves] if total else []
+            heading = f"⏱️ Top Stack Frames ({total} samples)"
+    except Exception as e:
+        await notice.edit(content=f"❌ Profiling failed: {e}")
+        return
+    finally:
+        profile_state['running'] = False
+
+    stalls = stall_detector.stats()
+    embed = discord.Embed(title="🔬 Event Loop Profile", color=0x9b59b6)
+    embed.add_field(name=heading,
+                    value="\n".join(lines)[:EMBED_FIELD_CHARS] or "Nothing ran",
+                    inline=False)
+    embed.add_field(
+        name="🐢 Loop Stalls",
+        value=f"{stalls['stalls']} over {STALL_THRESHOLD_SECONDS}s since start, "
+              f"worst {stalls['worst_s']}s. Stacks are in `{STALL_LOG_FILE}`",
+        inline=False)
+    embed.set_footer(text=f"Full results: {path}")
+    await notice.delete()
+    await ctx.send(embed=embed, file=discord.File(path))
+
+
 # Log and Update Commands
 
 @bot.command(name="rb_log")
@@ -1515,9 +1974,7 @@ async def rb_log(ctx, channel: discord.TextChannel):
         await ctx.send("❌ You don't have admin permissions!", delete_after=5)
         return
 
-    guild_str = str(ctx.guild.id)
-    log_channels[guild_str] = channel.id
-    save_data()
+    storage.set_log_channel(ctx.guild.id, channel.id)
 
     await ctx.send(f"✅ Log channel set to {channel.mention}!", delete_after=5)
 
@@ -1527,7 +1984,7 @@ async def rb_log(ctx, channel: discord.TextChannel):
         await ctx.send("✅ Restored data from previous messages!", delete_after=3)
 
     # Create initial embed
-    await update_log_embed(ctx.guild.id, channel)
+    await leaderboard_refresher.run_now(ctx.guild.id)
 
 
 @bot.command(name="update")
@@ -1546,13 +2003,12 @@ async def update(ctx, number: int = 50):
         await ctx.send("❌ You don't have admin permissions!", delete_after=5)
         return
 
-    guild_str = str(ctx.guild.id)
-    
+    channel_id = storage.get_log_channel(ctx.guild.id)
+
     # Use current channel if no log channel is set
-    if guild_str not in log_channels:
+    if not channel_id:
         channel = ctx.channel
-        log_channels[guild_str] = channel.id
-        save_data()
+        storage.set_log_channel(ctx.guild.id, channel.id)
         await ctx.send("✅ Using current channel as log channel!", delete_after=3)
         
         # Try to restore data from previous messages in this channel
@@ -1560,13 +2016,11 @@ async def update(ctx, number: int = 50):
         if restored:
             await ctx.send(f"✅ Restored data from last {number} messages!", delete_after=3)
     else:
-        channel_id = log_channels[guild_str]
         channel = bot.get_channel(channel_id)
         if not channel:
             # Fallback to current channel if saved channel not found
             channel = ctx.channel
-            log_channels[guild_str] = channel.id
-            save_data()
+            storage.set_log_channel(ctx.guild.id, channel.id)
             await ctx.send("✅ Previous log channel not found, using current channel!", delete_after=3)
             
         # Parse messages from the channel
@@ -1574,7 +2028,15 @@ async def update(ctx, number: int = 50):
         if restored:
             await ctx.send(f"✅ Restored data from last {number} messages!", delete_after=3)
 
-    await update_log_embed(ctx.guild.id, channel)
+    # Full member fetch only on demand, updates resolve members lazily
+    if not ctx.guild.chunked:
+        try:
+            await ctx.guild.chunk(cache=True)
+        except Exception:
+            pass  # Fallback if chunk fails
+    departed_members.pop(ctx.guild.id, None)
+
+    await leaderboard_refresher.run_now(ctx.guild.id)
     await ctx.send("✅ Leaderboard updated - showing only members with RP/Crowns/Brackets!", delete_after=3)
 
 
@@ -1595,12 +2057,7 @@ async def htr(ctx, *roles: discord.Role):
         await ctx.send("❌ Please mention at least one role!", delete_after=5)
         return
 
-    guild_str = str(ctx.guild.id)
-    if guild_str not in role_permissions:
-        role_permissions[guild_str] = {}
-
-    role_permissions[guild_str]['tournament_host'] = [role.id for role in roles]
-    save_data()
+    storage.set_roles(ctx.guild.id, 'tournament_host', [role.id for role in roles])
 
     role_mentions = [role.mention for role in roles]
     await ctx.send(
@@ -1619,12 +2076,7 @@ async def adr(ctx, role: discord.Role):
         await ctx.send("❌ You need Administrator permissions!", delete_after=5)
         return
 
-    guild_str = str(ctx.guild.id)
-    if guild_str not in role_permissions:
-        role_permissions[guild_str] = {}
-
-    role_permissions[guild_str]['admin'] = [role.id]
-    save_data()
+    storage.set_roles(ctx.guild.id, 'admin', [role.id])
 
     await ctx.send(f"✅ Admin role set to: {role.mention}!", delete_after=5)
 
@@ -1644,14 +2096,7 @@ async def tlr(ctx, *roles: discord.Role):
         await ctx.send("❌ Please mention at least one role!", delete_after=5)
         return
 
-    guild_str = str(ctx.guild.id)
-    if guild_str not in role_permissions:
-        role_permissions[guild_str] = {}
-
-    role_permissions[guild_str]['tournament_leader'] = [
-        role.id for role in roles
-    ]
-    save_data()
+    storage.set_roles(ctx.guild.id, 'tournament_leader', [role.id for role in roles])
 
     role_mentions = [role.mention for role in roles]
     await ctx.send(
@@ -1678,8 +2123,6 @@ async def hoster(ctx):
 
 # Run the bot
 if __name__ == "__main__":
-    keep_alive()
-
     # Load token from environment
     token = os.getenv('TOKEN')
     if not token:
@@ -1687,4 +2130,7 @@ if __name__ == "__main__":
         exit(1)
 
     print("🚀 Starting Discord Tournament Bot...")
-    bot.run(token)
+    try:
+        bot.run(token)
+    finally:
+        storage.close()
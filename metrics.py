@@ -0,0 +1,194 @@
+import functools
+import inspect
+import logging
+import re
+import threading
+import time
+
+# Latency buckets in seconds, the last one catches everything slower
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+
+class Histogram:
+    """Fixed-bucket latency histogram"""
+
+    __slots__ = ('counts', 'total', 'count')
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        self.total += seconds
+        self.count += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th observation"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for bound, n in zip(BUCKETS, self.counts):
+            cumulative += n
+            if cumulative >= rank:
+                return bound
+        return BUCKETS[-1]
+
+
+class Metrics:
+    """Counters and latency histograms keyed by name and label set"""
+
+    def __init__(self):
+        self.counters = {}  # name -> {labels: value}
+        self.histograms = {}  # name -> {labels: Histogram}
+        # Saves run in an executor thread
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _labels(labels):
+        return tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = self._labels(labels)
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = self._labels(labels)
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram()
+            histogram.observe(seconds)
+
+    def timed(self, name, **labels):
+        """Decorator recording latency into name and failures into name_errors_total"""
+        def decorate(func):
+            if not inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                def wrapper(*args, **kwargs):
+                    started = time.perf_counter()
+                    try:
+                        return func(*args, **kwargs)
+                    except Exception:
+                        self.inc(name + '_errors_total', **labels)
+                        raise
+                    finally:
+                        self.observe(name, time.perf_counter() - started, **labels)
+                return wrapper
+
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                except Exception:
+                    self.inc(name + '_errors_total', **labels)
+                    raise
+                finally:
+                    self.observe(name, time.perf_counter() - started, **labels)
+            return wrapper
+        return decorate
+
+    def counter_total(self, name):
+        return sum(self.counters.get(name, {}).values())
+
+    def summary(self, name):
+        """(labels, count, mean, p50, p95) per series of a histogram, busiest first"""
+        rows = []
+        with self._lock:
+            for key, histogram in self.histograms.get(name, {}).items():
+                rows.append((dict(key), histogram.count, histogram.total / histogram.count,
+                             histogram.quantile(0.5), histogram.quantile(0.95)))
+        rows.sort(key=lambda row: -row[1])
+        return rows
+
+    def render_prometheus(self):
+        """All series in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name, series in sorted(self.counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                for key, value in series.items():
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+
+            for name, series in sorted(self.histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in series.items():
+                    cumulative = 0
+                    for bound, n in zip(BUCKETS, histogram.counts):
+                        cumulative += n
+                        le = '+Inf' if bound == float('inf') else repr(bound)
+                        lines.append(f"{name}_bucket{_format_labels(key + (('le', le),))} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {histogram.total}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(key):
+    if not key:
+        return ""
+    parts = []
+    for label, value in key:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{label}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+metrics = Metrics()
+
+
+def instrument_http(http, registry=metrics):
+    """Count and time every Discord REST call by method and route template"""
+    original = http.request
+
+    @functools.wraps(original)
+    async def request(route, **kwargs):
+        labels = {'method': route.method, 'route': route.path}
+        registry.inc('discord_api_calls_total', **labels)
+        started = time.perf_counter()
+        try:
+            return await original(route, **kwargs)
+        except Exception:
+            registry.inc('discord_api_errors_total', **labels)
+            raise
+        finally:
+            registry.observe('discord_api_seconds', time.perf_counter() - started, **labels)
+
+    http.request = request
+
+
+class RateLimitLogHandler(logging.Handler):
+    """Turn discord.py's rate limit log records into counters and wait times"""
+
+    SECONDS = re.compile(r'(?:retrying in|for) ([0-9.]+) seconds', re.IGNORECASE)
+
+    def __init__(self, registry=metrics):
+        super().__init__(logging.DEBUG)
+        self.registry = registry
+
+    def emit(self, record):
+        try:
+            message = record.getMessage()
+        except Exception:
+            return
+        lowered = message.lower()
+        if 'rate limit' not in lowered:
+            return
+        self.registry.inc('discord_rate_limits_total',
+                          kind='global' if 'global' in lowered else 'route')
+        match = self.SECONDS.search(message)
+        if match:
+            self.registry.observe('discord_rate_limit_wait_seconds', float(match.group(1)))
+
+
+def watch_rate_limits(logger_name='discord.http', registry=metrics):
+    """Count 429s and rate limit waits discord.py logs (debug-level waits only if that logger is at DEBUG)"""
+    logging.getLogger(logger_name).addHandler(RateLimitLogHandler(registry))
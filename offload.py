@@ -0,0 +1,82 @@
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from metrics import metrics
+
+
+class Offloader:
+    """Runs blocking work off the event loop
+
+    io() uses a thread pool for file writes and other calls that release the GIL.
+    cpu() uses a process pool for pure-Python CPU work like JSON encoding or
+    rendering a huge leaderboard, which would still hold the GIL in a thread.
+    Functions and arguments given to cpu() must be picklable (module-level functions).
+    Work smaller than cpu_min_size runs inline, where it is cheaper than the
+    pickling round trip. If the process pool can't start or breaks, cpu()
+    falls back to the thread pool, where the loop at least gets GIL turns.
+    """
+
+    def __init__(self, io_workers=4, cpu_workers=2, cpu_min_size=5000):
+        self.io_workers = io_workers
+        self.cpu_workers = cpu_workers
+        self.cpu_min_size = cpu_min_size
+        self._io = None
+        self._cpu = None
+        self._cpu_failed = False
+
+    def _io_pool(self):
+        if self._io is None:
+            self._io = ThreadPoolExecutor(max_workers=self.io_workers,
+                                          thread_name_prefix='offload-io')
+        return self._io
+
+    def _cpu_pool(self):
+        if self._cpu is None and not self._cpu_failed and self.cpu_workers > 0:
+            # spawn, since forking a process that runs the gateway and saver threads can deadlock
+            try:
+                self._cpu = ProcessPoolExecutor(max_workers=self.cpu_workers,
+                                                mp_context=multiprocessing.get_context('spawn'))
+            except (OSError, NotImplementedError) as e:
+                self._cpu_failed = True
+                print(f"⚠️ No process pool available ({e}), CPU work runs in threads")
+        return self._cpu
+
+    async def _run(self, pool, label, func, *args):
+        started = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(pool, func, *args)
+        finally:
+            metrics.observe('offload_seconds', time.perf_counter() - started,
+                            pool=label, func=func.__name__)
+
+    async def io(self, func, *args):
+        """Run a blocking call in the I/O thread pool"""
+        return await self._run(self._io_pool(), 'io', func, *args)
+
+    async def cpu(self, func, *args, size=None):
+        """Run a CPU-bound function in a worker process, size is a hint like a row count"""
+        if size is not None and size < self.cpu_min_size:
+            return func(*args)
+        pool = self._cpu_pool()
+        if pool is None:
+            return await self._run(self._io_pool(), 'io', func, *args)
+
+        try:
+            return await self._run(pool, 'cpu', func, *args)
+        except BrokenProcessPool as e:
+            # A worker died (OOM killer, ...), start a fresh pool next time
+            print(f"⚠️ CPU worker pool broke ({e}), retrying in a thread")
+            if self._cpu is pool:
+                self._cpu = None
+                pool.shutdown(wait=False, cancel_futures=True)
+            return await self._run(self._io_pool(), 'io', func, *args)
+
+    def shutdown(self, wait=True):
+        for pool in (self._io, self._cpu):
+            if pool is not None:
+                pool.shutdown(wait=wait, cancel_futures=True)
+        self._io = None
+        self._cpu = None
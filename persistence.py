@@ -0,0 +1,294 @@
+import asyncio
+import json
+import os
+import shutil
+import threading
+import time
+
+import codec
+from metrics import metrics
+
+
+def encode_snapshot(data, fmt='json'):
+    """Serialized form of a snapshot, module-level so it can run in a worker process"""
+    return codec.encode(data, fmt)
+
+
+class WriteBehindSaver:
+    """Coalesce save requests into one debounced, atomic background write"""
+
+    def __init__(self, path, snapshot, backup_path=None, debounce=2.0,
+                 on_commit=None, offload=None, fmt='json', size_of=None):
+        self.path = path
+        self.backup_path = backup_path
+        self.snapshot = snapshot  # Called on the event loop, must return a private copy
+        self.on_commit = on_commit  # Called with the written data after a successful save
+        self.debounce = debounce
+        self.offload = offload  # Offloader for encoding and writing, else the default executor
+        self.fmt = fmt  # codec format the snapshot is written in
+        self.size_of = size_of  # Size hint for a snapshot (e.g. user count), small ones encode inline
+        self.dirty = False
+        self.last_save = None
+        self.backup_refreshed = False  # Whether the last write moved the previous file to the backup
+        self.saves = 0
+        self.coalesced = 0
+        self._task = None
+        self._lock = None
+        self._can_link = True
+
+    def mark_dirty(self):
+        """Flag data as changed and schedule a flush after the debounce window"""
+        if self.dirty:
+            self.coalesced += 1
+        self.dirty = True
+        self._schedule()
+
+    def _schedule(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # No loop yet/anymore, flush_sync() will pick it up
+
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        # Changes made while a write was in flight (or a failed write) need another round
+        while self.dirty:
+            await asyncio.sleep(self.debounce)
+            await self.flush()
+
+    async def flush(self):
+        """Write pending changes now (serialization and fsync run off the event loop)"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            if not self.dirty:
+                return
+            self.dirty = False
+            data = self.snapshot()
+            try:
+                if self.offload:
+                    # Encoding holds the GIL, so a thread would still stall the loop
+                    size = self.size_of(data) if self.size_of else None
+                    payload = await self.offload.cpu(encode_snapshot, data, self.fmt, size=size)
+                    await self.offload.io(self._write_payload, payload)
+                else:
+                    await asyncio.get_running_loop().run_in_executor(
+                        None, self._write, data)
+            except Exception as e:
+                self.dirty = True
+                print(f"⚠️ Error saving data: {e}")
+                self._schedule()  # Retry after the debounce window
+                return
+            if self.offload:
+                # on_commit rewrites the journal, that file I/O stays off the loop too
+                await self.offload.io(self._committed, data)
+            else:
+                self._committed(data)
+
+    def flush_sync(self):
+        """Blocking flush used on shutdown when the event loop is gone"""
+        if not self.dirty:
+            return
+        self.dirty = False
+        data = self.snapshot()
+        try:
+            self._write(data)
+        except Exception as e:
+            self.dirty = True
+            print(f"⚠️ Error saving data: {e}")
+            return
+        self._committed(data)
+
+    def _committed(self, data):
+        if self.on_commit:
+            try:
+                self.on_commit(data)
+            except Exception as e:
+                print(f"⚠️ Error after saving data: {e}")
+
+    def _write(self, data):
+        self._write_payload(encode_snapshot(data, self.fmt))
+
+    @metrics.timed('save_seconds')
+    def _write_payload(self, payload):
+        tmp_path = self.path + '.tmp'
+
+        with open(tmp_path, 'wb') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+
+        # Keep the previous version as backup without rewriting it
+        self.backup_refreshed = False
+        if self.backup_path and os.path.exists(self.path):
+            self.backup_refreshed = self._link_backup()
+
+        os.replace(tmp_path, self.path)
+        self._fsync_dir()
+        self.last_save = time.time()
+        self.saves += 1
+
+    def _link_backup(self):
+        """Point the backup at the current file, returns False if the backup is left stale"""
+        tmp_backup = self.backup_path + '.tmp'
+        if self._can_link:
+            try:
+                if os.path.exists(tmp_backup):
+                    os.remove(tmp_backup)
+                os.link(self.path, tmp_backup)
+                os.replace(tmp_backup, self.backup_path)
+                return True
+            except OSError as e:
+                # No hard links here (filesystem, cross-device, permissions), copy from now on
+                self._can_link = False
+                print(f"⚠️ Could not link backup ({e}), copying it instead")
+        try:
+            shutil.copy2(self.path, tmp_backup)
+            os.replace(tmp_backup, self.backup_path)
+            return True
+        except OSError as e:
+            print(f"❌ Could not refresh backup {self.backup_path}: {e}")
+            return False
+
+    def _fsync_dir(self):
+        try:
+            fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+
+class Journal:
+    """Append-only log of small state mutations, replayed on top of the last snapshot"""
+
+    def __init__(self, path):
+        self.path = path
+        self.seq = 0  # Sequence number of the last appended record
+        self.snapshot_seq = 0  # Last sequence number contained in a committed snapshot
+        self.last_compact = time.time()
+        self.last_write = None
+        self._file = None
+        self._torn = False
+        self._lock = threading.RLock()  # compact() may run in a worker thread
+
+    @property
+    def pending(self):
+        """Number of records not yet folded into a snapshot"""
+        return self.seq - self.snapshot_seq
+
+    def append(self, op, *args):
+        with self._lock:
+            self.seq += 1
+            record = [self.seq, op, *args]
+            if self._file is None:
+                self._file = open(self.path, 'a', encoding='utf-8')
+            # One compact line per mutation, flushed so it survives a process crash
+            self._file.write(json.dumps(record, separators=(',', ':'),
+                                        ensure_ascii=False) + '\n')
+            self._file.flush()
+        self.last_write = time.time()
+        metrics.inc('journal_records_total')
+
+    def _size(self):
+        """Bytes in the journal file, every record up to there is complete"""
+        if self._file is not None:
+            self._file.flush()
+        try:
+            return os.path.getsize(self.path)
+        except FileNotFoundError:
+            return 0
+
+    def _read(self, end=None):
+        """Records in the first end bytes of the file, all of it by default"""
+        records = []
+        self._torn = False
+        try:
+            with open(self.path, 'rb') as f:
+                content = f.read() if end is None else f.read(end)
+        except FileNotFoundError:
+            return records
+        for line in content.decode('utf-8', errors='replace').splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                # Torn write from a crash, nothing after it is trustworthy
+                print(f"⚠️ Ignoring truncated journal record in {self.path}")
+                self._torn = True
+                break
+        return records
+
+    def replay(self, after_seq, apply):
+        """Apply every record newer than after_seq, returns how many were applied"""
+        with self._lock:
+            self.close()
+            self.seq = self.snapshot_seq = after_seq
+            applied = 0
+            for record in self._read():
+                seq, op, args = record[0], record[1], record[2:]
+                if seq <= after_seq:
+                    continue
+                if not applied and seq != after_seq + 1:
+                    print(f"❌ Journal resumes at record {seq} but the snapshot ends at "
+                          f"{after_seq}, records in between are lost")
+                try:
+                    apply(op, *args)
+                    applied += 1
+                except Exception as e:
+                    print(f"⚠️ Error replaying journal record {record}: {e}")
+                self.seq = max(self.seq, seq)
+
+            # Rewrite the file so new records don't get appended to a torn line
+            if self._torn:
+                self.compact(after_seq)
+            return applied
+
+    def compact(self, upto_seq, snapshot_seq=None):
+        """Drop records up to upto_seq, snapshot_seq is the newest committed snapshot if later
+
+        Safe to call from a worker thread: the bulk of the rewrite happens without
+        the lock, records appended meanwhile are copied over at the end.
+        """
+        with self._lock:
+            end = self._size()
+        keep = [r for r in self._read(end) if r[0] > upto_seq]
+        torn = self._torn
+
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            for record in keep:
+                f.write((json.dumps(record, separators=(',', ':'),
+                                    ensure_ascii=False) + '\n').encode())
+            with self._lock:
+                # A torn file is only rewritten during replay, nothing follows the tear
+                if not torn and self._size() > end:
+                    with open(self.path, 'rb') as source:
+                        source.seek(end)
+                        f.write(source.read())
+                f.flush()
+                os.fsync(f.fileno())
+                self.close()
+                os.replace(tmp_path, self.path)
+                self.snapshot_seq = max(self.snapshot_seq, upto_seq, snapshot_seq or 0)
+        self.last_compact = time.time()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                try:
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+                except OSError:
+                    pass
+                self._file.close()
+                self._file = None
@@ -0,0 +1,156 @@
+import asyncio
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from datetime import datetime
+
+from metrics import metrics
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StallDetector:
+    """Dump the loop thread's stack whenever a callback blocks the event loop longer than threshold
+
+    A heartbeat on the loop stamps the time every interval; a watchdog thread
+    notices a stale stamp while the loop is still blocked, so the stack it
+    captures is the code doing the blocking. Stalls are appended to path.
+    Every heartbeat also records how late it ran as the loop lag.
+    """
+
+    def __init__(self, threshold=0.5, path='loop_stalls.log'):
+        self.threshold = threshold
+        self.interval = threshold / 4
+        self.path = path
+        self.stalls = 0
+        self.worst = 0.0
+        self.last_stall = None
+        self.lag = 0.0  # How late the last heartbeat ran
+        self._beat = time.monotonic()
+        self._reported_beat = None
+        self._loop = None
+        self._loop_thread = None
+        self._handle = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """Start watching the running loop, call from a coroutine on that loop"""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._handle = self._loop.call_later(self.interval, self._heartbeat)
+        self._stop.clear()
+        threading.Thread(target=self._watch, name='stall-detector', daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+        if self._handle:
+            self._handle.cancel()
+
+    def _heartbeat(self):
+        now = time.monotonic()
+        blocked = now - self._beat - self.interval
+        self.lag = max(blocked, 0.0)
+        metrics.observe('event_loop_lag_seconds', self.lag)
+        if blocked > self.threshold:
+            self.stalls += 1
+            self.worst = max(self.worst, blocked)
+            self.last_stall = time.time()
+            metrics.inc('event_loop_stalls_total')
+            print(f"⚠️ Event loop was blocked for {blocked:.2f}s")
+        self._beat = now
+        self._handle = self._loop.call_later(self.interval, self._heartbeat)
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            beat = self._beat
+            if time.monotonic() - beat - self.interval <= self.threshold or beat == self._reported_beat:
+                continue
+            # Report each stall once, while it is still happening
+            self._reported_beat = beat
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            stack = traceback.format_stack(frame)
+            print(f"⚠️ Event loop blocked for over {self.threshold}s in "
+                  f"{_frame_label(frame.f_code)}, stack written to {self.path}")
+            try:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(f"--- {datetime.now().isoformat()} loop blocked for over "
+                            f"{self.threshold}s ---\n")
+                    f.write(''.join(stack))
+                    f.write("\n")
+            except OSError as e:
+                print(f"⚠️ Could not write stall log: {e}")
+
+    def stats(self):
+        return {
+            'lag_ms': round(self.lag * 1000, 1),
+            'stalls': self.stalls,
+            'worst_s': round(self.worst, 3),
+            'last_stall': self.last_stall
+        }
+
+
+async def profile_loop(seconds, path, limit=10):
+    """cProfile everything the loop runs for seconds, saves pstats to path
+
+    Returns the top functions by own time as (calls, own seconds, cumulative seconds, label).
+    Work handed to executor threads is not included.
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.disable()
+    profiler.dump_stats(path)
+
+    rows = []
+    for (filename, line, name), (_, calls, own, cumulative, _) in pstats.Stats(profiler).stats.items():
+        rows.append((calls, own, cumulative, f"{name} ({os.path.basename(filename)}:{line})"))
+    rows.sort(key=lambda row: -row[1])
+    return rows[:limit]
+
+
+async def sample_loop(seconds, path, interval=0.005, limit=10):
+    """Sample the loop thread's stack every interval for seconds, saves collapsed stacks to path
+
+    The file is in the folded format flame graph tools read. Returns the total
+    sample count and the top functions by samples on top of the stack.
+    """
+    loop_thread = threading.get_ident()
+    stacks = Counter()
+    done = threading.Event()
+
+    def sampler():
+        while not done.wait(interval):
+            frame = sys._current_frames().get(loop_thread)
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            if labels:
+                stacks[';'.join(reversed(labels))] += 1
+
+    thread = threading.Thread(target=sampler, name='loop-sampler', daemon=True)
+    thread.start()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        done.set()
+        await asyncio.to_thread(thread.join)
+
+    leaves = Counter()
+    with open(path, 'w', encoding='utf-8') as f:
+        for stack, count in stacks.most_common():
+            f.write(f"{stack} {count}\n")
+            leaves[stack.rsplit(';', 1)[-1]] += count
+    return sum(stacks.values()), leaves.most_common(limit)
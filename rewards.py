@@ -0,0 +1,74 @@
+import csv
+import io
+import re
+
+# Bulk line operation -> (storage change kind, sign for amounts)
+BULK_OPS = {
+    'rp_add': ('rp', 1),
+    'rp_rmv': ('rp', -1),
+    'crwn_add': ('crown', 1),
+    'crwn_rmv': ('crown', -1),
+    'brkt_add': ('brkt_add', None),
+    'brkt_rmv': ('brkt_rmv', None)
+}
+
+USER_TOKEN = re.compile(r'^(?:<@!?(\d+)>|(\d+))$')
+
+
+def parse_reward_row(row):
+    """Turn one [op, user, value] row into a (user_id, kind, value) change, raises ValueError"""
+    if len(row) < 2:
+        raise ValueError("expected `<op> <@user> [value]`")
+    op, user = row[0].strip().lower().lstrip('!'), row[1].strip()
+    value = row[2].strip() if len(row) > 2 and row[2].strip() else None
+
+    if op not in BULK_OPS:
+        raise ValueError(f"unknown operation `{op}`")
+    match = USER_TOKEN.match(user)
+    if not match:
+        raise ValueError(f"`{user}` is not a user mention or ID")
+    user_id = int(match.group(1) or match.group(2))
+
+    kind, sign = BULK_OPS[op]
+    if sign is not None:
+        try:
+            amount = int(value) if value is not None else 1
+        except ValueError:
+            raise ValueError(f"`{value}` is not a whole number")
+        if amount < 0:
+            raise ValueError("amount must not be negative, use the _rmv operation")
+        return user_id, kind, sign * amount
+
+    if kind == 'brkt_add' and value is None:
+        raise ValueError("brkt_add needs an emoji")
+    return user_id, kind, value
+
+
+def parse_reward_lines(rows):
+    """Parse (line, row) pairs, returns (changes, errors) with errors as (line, message)"""
+    changes = []
+    errors = []
+    for line_no, row in rows:
+        if not row or not ''.join(row).strip() or row[0].strip().startswith('#'):
+            continue
+        try:
+            changes.append(parse_reward_row(row))
+        except ValueError as e:
+            errors.append((line_no, str(e)))
+    return changes, errors
+
+
+def text_rows(text):
+    """Rows of a whitespace separated command body, one change per line"""
+    return [(i, line.split()) for i, line in enumerate(text.splitlines(), 1)]
+
+
+def csv_rows(data, source='csv'):
+    """Rows of an uploaded CSV file (op,user,value), an optional header row is skipped"""
+    reader = csv.reader(io.StringIO(data.decode('utf-8-sig')))
+    rows = []
+    for i, row in enumerate(reader, 1):
+        if i == 1 and row and row[0].strip().lower() in ('op', 'operation', 'action'):
+            continue
+        rows.append((f"{source}:{i}", row))
+    return rows
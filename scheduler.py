@@ -0,0 +1,81 @@
+import asyncio
+import time
+
+
+class CoalescingScheduler:
+    """Run an async callback per key at most once per interval, folding repeated requests together"""
+
+    def __init__(self, callback, interval=10.0, delay=1.0):
+        self.callback = callback  # async callback(key)
+        self.interval = interval  # Minimum time between two runs for the same key
+        self.delay = delay  # Time to gather a burst before the first run
+        self.requests = 0
+        self.runs = 0
+        self.coalesced = 0
+        self.errors = 0
+        self._pending = set()
+        self._tasks = {}
+        self._locks = {}
+        self._last_run = {}
+
+    def request(self, key):
+        """Mark key dirty, a run is scheduled unless one is already pending"""
+        self.requests += 1
+        if key in self._pending:
+            self.coalesced += 1
+            return
+        self._pending.add(key)
+
+        task = self._tasks.get(key)
+        if task is None or task.done():
+            self._tasks[key] = asyncio.create_task(self._worker(key))
+
+    async def _worker(self, key):
+        await asyncio.sleep(self.delay)
+        while key in self._pending:
+            wait = self._last_run.get(key, 0) + self.interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            if key in self._pending:
+                await self._run(key)
+
+    async def _run(self, key):
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            # Requests arriving from here on need another run
+            self._pending.discard(key)
+            self._last_run[key] = time.monotonic()
+            self.runs += 1
+            try:
+                await self.callback(key)
+            except Exception as e:
+                self.errors += 1
+                print(f"⚠️ Scheduled refresh for {key} failed: {e}")
+
+    async def run_now(self, key):
+        """Run immediately, absorbing anything pending for key"""
+        if key in self._pending:
+            self.coalesced += 1
+        await self._run(key)
+
+    async def flush(self):
+        """Run every pending key now instead of waiting out its delay"""
+        for key in list(self._pending):
+            await self.run_now(key)
+
+    async def drain(self):
+        """Wait until no run is pending or in progress"""
+        while True:
+            tasks = [task for task in self._tasks.values() if not task.done()]
+            if not tasks:
+                return
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'runs': self.runs,
+            'coalesced': self.coalesced,
+            'pending': len(self._pending),
+            'errors': self.errors
+        }
@@ -0,0 +1,816 @@
+import json
+import os
+import sqlite3
+import time
+
+import codec
+from leaderboard import GuildRanking
+from persistence import WriteBehindSaver, Journal
+
+
+class Storage:
+    """Interface every state backend implements (RP, crowns, brackets, permissions, log channels)"""
+
+    def load(self):
+        raise NotImplementedError
+
+    async def flush(self):
+        """Persist anything still pending"""
+
+    def close(self):
+        """Flush synchronously and release resources on shutdown"""
+
+    def last_save(self):
+        """Unix time of the last successful write to disk, or None"""
+        return None
+
+    # RP, crowns and bracket emojis
+
+    def get_rp(self, guild_id, user_id):
+        raise NotImplementedError
+
+    def get_crowns(self, guild_id, user_id):
+        raise NotImplementedError
+
+    def add_rp(self, guild_id, user_id, amount):
+        raise NotImplementedError
+
+    def add_crowns(self, guild_id, user_id, amount):
+        raise NotImplementedError
+
+    def get_brackets(self, guild_id, user_id):
+        raise NotImplementedError
+
+    def add_bracket(self, guild_id, user_id, emoji):
+        raise NotImplementedError
+
+    def remove_bracket(self, guild_id, user_id, emoji=None):
+        """Remove one bracket emoji, or all of them when emoji is None"""
+        raise NotImplementedError
+
+    def restore_entry(self, guild_id, user_id, rp=None, crowns=None, brackets=None):
+        """Merge values parsed from an old leaderboard (keeps the higher score, never overwrites brackets)"""
+        raise NotImplementedError
+
+    def restore_entries(self, guild_id, rows):
+        """restore_entry for many (user_id, rp, crowns, brackets) rows as one write
+
+        Rows that wouldn't change anything are skipped, returns how many were merged.
+        """
+        raise NotImplementedError
+
+    def apply_rewards(self, guild_id, changes):
+        """Apply many (user_id, kind, value) changes as one write
+
+        kind is 'rp' or 'crown' (value is the amount to add), 'brkt_add' or
+        'brkt_rmv' (value is the emoji, None removes every emoji).
+        """
+        raise NotImplementedError
+
+    def reset_guild(self, guild_id):
+        raise NotImplementedError
+
+    def has_scores(self, guild_id):
+        """True if anyone in the guild has RP or crowns recorded"""
+        raise NotImplementedError
+
+    def guild_entries(self, guild_id):
+        """All (user_id, rp, crowns, brackets) rows with RP, crowns or bracket emojis, in leaderboard order"""
+        raise NotImplementedError
+
+    def top(self, guild_id, by='rp', limit=10, offset=0):
+        """Highest (user_id, rp, crowns) rows ordered by RP or crowns"""
+        raise NotImplementedError
+
+    def rank(self, guild_id, user_id):
+        """(position, total) of a user on the RP leaderboard, or None if unranked"""
+        raise NotImplementedError
+
+    # Settings
+
+    def get_roles(self, guild_id, permission_type):
+        raise NotImplementedError
+
+    def set_roles(self, guild_id, permission_type, role_ids):
+        raise NotImplementedError
+
+    def get_log_channel(self, guild_id):
+        raise NotImplementedError
+
+    def set_log_channel(self, guild_id, channel_id):
+        raise NotImplementedError
+
+    def log_channels(self):
+        """Mapping of guild id to log channel id"""
+        raise NotImplementedError
+
+    def get_leaderboard_pages(self, guild_id):
+        """[message_id, digest] of each leaderboard page in the log channel"""
+        raise NotImplementedError
+
+    def set_leaderboard_pages(self, guild_id, pages):
+        raise NotImplementedError
+
+    # Tournaments
+
+    def save_tournament(self, guild_id, record):
+        raise NotImplementedError
+
+    def delete_tournament(self, guild_id):
+        raise NotImplementedError
+
+    def load_tournaments(self):
+        """Mapping of guild id to saved tournament record"""
+        raise NotImplementedError
+
+
+class JsonStorage(Storage):
+    """Default backend: in-memory dicts, JSON snapshot + append-only journal"""
+
+    # Mutations that move users on the leaderboard
+    SCORE_OPS = {'rp', 'crown', 'brkt_add', 'brkt_rmv', 'restore', 'reset'}
+    # Mutations that can be grouped into one 'batch' record
+    REWARD_OPS = {'rp', 'crown', 'brkt_add', 'brkt_rmv'}
+
+    def __init__(self, path='user_data.json', backup_path='user_data_backup.json',
+                 journal_path='user_data.journal', debounce=2.0,
+                 compact_records=500, compact_seconds=300, offload=None,
+                 data_format='json'):
+        self.path = path
+        self.backup_path = backup_path
+        self.compact_records = compact_records
+        self.compact_seconds = compact_seconds
+        self.rp_data = {}
+        self.crown_data = {}
+        self.role_permissions = {}
+        self.bracket_roles = {}
+        self.log_channel_ids = {}
+        self.leaderboard_pages = {}
+        self.tournament_records = {}
+        self.rankings = {}  # guild_str -> GuildRanking, built on first use
+        self.disk_seq = 0  # journal_seq of the snapshot in the main file, the next backup
+        self.backup_seq = None  # journal_seq of the backup, None until a save refreshed it
+        self.journal = Journal(journal_path)
+        self.saver = WriteBehindSaver(path, self.snapshot,
+                                      backup_path=backup_path,
+                                      debounce=debounce,
+                                      on_commit=self._compact_journal,
+                                      offload=offload,
+                                      fmt=data_format,
+                                      size_of=self._snapshot_size)
+
+    def _read_file(self):
+        """Read the main data file in whichever format it was written, falling back to the backup if it is unreadable"""
+        try:
+            with open(self.path, 'rb') as f:
+                return codec.decode(f.read())
+        except ValueError as e:
+            print(f"⚠️ Data file is corrupt ({e}), trying backup")
+            with open(self.backup_path, 'rb') as f:
+                return codec.decode(f.read())
+
+    def load(self):
+        try:
+            data = self._read_file()
+            print("✅ Data loaded successfully")
+        except FileNotFoundError:
+            print("📂 No data file found, starting fresh")
+            data = {}
+        except Exception as e:
+            print(f"⚠️ Error loading data: {e}")
+            data = {}
+
+        # Support both old TP data and new RP data for migration
+        self.rp_data = data.get('rp_data', data.get('tp_data', {}))
+        self.crown_data = data.get('crown_data', {})
+        self.role_permissions = data.get('role_permissions', {})
+        self.bracket_roles = data.get('bracket_roles', {})
+        self.log_channel_ids = data.get('log_channels', {})
+        self.leaderboard_pages = data.get('leaderboard_pages', {})
+        self.tournament_records = data.get('tournaments', {})
+        self.rankings = {}
+
+        # Replay mutations recorded after the snapshot was written
+        self.disk_seq = data.get('journal_seq', 0)
+        self.backup_seq = None
+        replayed = self.journal.replay(self.disk_seq, self._apply)
+        if replayed:
+            print(f"✅ Replayed {replayed} journal entries")
+
+    def snapshot(self):
+        """Copy all persisted state so it can be serialized off the event loop"""
+        return {
+            'rp_data': {g: dict(users) for g, users in self.rp_data.items()},
+            'crown_data': {g: dict(users) for g, users in self.crown_data.items()},
+            'role_permissions': {
+                g: {perm: list(roles) for perm, roles in perms.items()}
+                for g, perms in self.role_permissions.items()
+            },
+            'bracket_roles': {
+                g: {u: list(emojis) for u, emojis in users.items()}
+                for g, users in self.bracket_roles.items()
+            },
+            'log_channels': dict(self.log_channel_ids),
+            'leaderboard_pages': {
+                g: [list(page) for page in pages]
+                for g, pages in self.leaderboard_pages.items()
+            },
+            # Records are replaced wholesale, never mutated, so sharing them is safe
+            'tournaments': dict(self.tournament_records),
+            'journal_seq': self.journal.seq
+        }
+
+    @staticmethod
+    def _snapshot_size(data):
+        """Users across the per-user tables, what encoding time scales with"""
+        return sum(len(users) for table in ('rp_data', 'crown_data', 'bracket_roles')
+                   for users in data[table].values())
+
+    def _compact_journal(self, data):
+        """Drop journal records that both the new snapshot and the backup contain
+
+        When the write turned the previous snapshot into the backup, records after
+        its seq are kept; loading the backup can then still replay up to now.
+        A backup that couldn't be refreshed keeps its older seq.
+        """
+        if self.saver.backup_refreshed:
+            self.backup_seq = self.disk_seq
+        self.disk_seq = data['journal_seq']
+        self.journal.compact(self.backup_seq or 0, snapshot_seq=self.disk_seq)
+
+    def save(self):
+        """Mark data as changed, the write happens in the background"""
+        self.saver.mark_dirty()
+
+    async def flush(self):
+        await self.saver.flush()
+
+    def close(self):
+        self.saver.flush_sync()
+        self.journal.close()
+
+    def last_save(self):
+        # A journal append is durable too, not just a snapshot
+        times = [t for t in (self.saver.last_save, self.journal.last_write) if t]
+        return max(times) if times else None
+
+    def _apply(self, op, guild_str, *args):
+        """Apply one journaled mutation to the in-memory state"""
+        if op == 'rp' or op == 'crown':
+            user_str, amount = args
+            data = self.rp_data if op == 'rp' else self.crown_data
+            if guild_str not in data:
+                data[guild_str] = {}
+            data[guild_str][user_str] = data[guild_str].get(user_str, 0) + amount
+
+        elif op == 'brkt_add':
+            user_str, emoji = args
+            if guild_str not in self.bracket_roles:
+                self.bracket_roles[guild_str] = {}
+            if user_str not in self.bracket_roles[guild_str]:
+                self.bracket_roles[guild_str][user_str] = []
+            if emoji not in self.bracket_roles[guild_str][user_str]:
+                self.bracket_roles[guild_str][user_str].append(emoji)
+
+        elif op == 'brkt_rmv':
+            user_str, emoji = args
+            user_brackets = self.bracket_roles.get(guild_str, {}).get(user_str)
+            if user_brackets is None:
+                return
+            if emoji is None:
+                del self.bracket_roles[guild_str][user_str]
+            elif emoji in user_brackets:
+                user_brackets.remove(emoji)
+                if not user_brackets:  # Remove empty list
+                    del self.bracket_roles[guild_str][user_str]
+
+        elif op == 'restore':
+            user_str, rp, crowns, brackets = args
+            if rp is not None:
+                guild_rp = self.rp_data.setdefault(guild_str, {})
+                guild_rp[user_str] = max(rp, guild_rp.get(user_str, 0))
+            if crowns is not None:
+                guild_crowns = self.crown_data.setdefault(guild_str, {})
+                guild_crowns[user_str] = max(crowns, guild_crowns.get(user_str, 0))
+            if brackets:
+                guild_brackets = self.bracket_roles.setdefault(guild_str, {})
+                user_brackets = guild_brackets.setdefault(user_str, [])
+                for emoji in brackets:
+                    if emoji not in user_brackets:
+                        user_brackets.append(emoji)
+
+        elif op == 'restore_batch':
+            rows, = args
+            for row in rows:
+                self._apply('restore', guild_str, *row)
+
+        elif op == 'batch':
+            changes, = args
+            for change_op, user_str, value in changes:
+                if change_op not in self.REWARD_OPS:
+                    raise ValueError(f"Unknown reward change {change_op}")
+                self._apply(change_op, guild_str, user_str, value)
+
+        elif op == 'pages':
+            pages, = args
+            self.leaderboard_pages[guild_str] = pages
+
+        elif op == 'roles':
+            permission_type, role_ids = args
+            self.role_permissions.setdefault(guild_str, {})[permission_type] = role_ids
+
+        elif op == 'log_channel':
+            channel_id, = args
+            self.log_channel_ids[guild_str] = channel_id
+
+        elif op == 'tournament':
+            record, = args
+            if record is None:
+                self.tournament_records.pop(guild_str, None)
+            else:
+                self.tournament_records[guild_str] = record
+
+        elif op == 'reset':
+            if guild_str in self.rp_data:
+                self.rp_data[guild_str] = {}
+            if guild_str in self.crown_data:
+                self.crown_data[guild_str] = {}
+            if guild_str in self.bracket_roles:
+                self.bracket_roles[guild_str] = {}
+
+        else:
+            raise ValueError(f"Unknown mutation {op}")
+
+    def _mutate(self, op, guild_id, *args):
+        """Apply a mutation and append it to the journal instead of rewriting the data file"""
+        self._apply(op, str(guild_id), *args)
+        if op in self.SCORE_OPS:
+            self._reindex(str(guild_id), args[0] if args else None)
+        elif op == 'batch':
+            for user_str in {change[1] for change in args[0]}:
+                self._reindex(str(guild_id), user_str)
+        elif op == 'restore_batch':
+            for row in args[0]:
+                self._reindex(str(guild_id), row[0])
+        self.journal.append(op, str(guild_id), *args)
+
+        # Periodically fold the journal into a fresh snapshot
+        if (self.journal.pending >= self.compact_records or
+                time.time() - self.journal.last_compact >= self.compact_seconds):
+            self.save()
+
+    def _ranking(self, guild_str):
+        ranking = self.rankings.get(guild_str)
+        if ranking is None:
+            ranking = self.rankings[guild_str] = GuildRanking()
+            guild_rp = self.rp_data.get(guild_str, {})
+            guild_crowns = self.crown_data.get(guild_str, {})
+            guild_brackets = self.bracket_roles.get(guild_str, {})
+            for user_str in set(guild_rp) | set(guild_crowns) | set(guild_brackets):
+                ranking.update(int(user_str), guild_rp.get(user_str, 0),
+                               guild_crowns.get(user_str, 0),
+                               bool(guild_brackets.get(user_str)))
+        return ranking
+
+    def _reindex(self, guild_str, user_str):
+        """Move one user inside an already built ranking (or drop it after a reset)"""
+        ranking = self.rankings.get(guild_str)
+        if ranking is None:
+            return
+        if user_str is None:
+            del self.rankings[guild_str]
+            return
+        ranking.update(int(user_str),
+                       self.rp_data.get(guild_str, {}).get(user_str, 0),
+                       self.crown_data.get(guild_str, {}).get(user_str, 0),
+                       bool(self.bracket_roles.get(guild_str, {}).get(user_str)))
+
+    def get_rp(self, guild_id, user_id):
+        return self.rp_data.get(str(guild_id), {}).get(str(user_id), 0)
+
+    def get_crowns(self, guild_id, user_id):
+        return self.crown_data.get(str(guild_id), {}).get(str(user_id), 0)
+
+    def add_rp(self, guild_id, user_id, amount):
+        self._mutate('rp', guild_id, str(user_id), amount)
+
+    def add_crowns(self, guild_id, user_id, amount):
+        self._mutate('crown', guild_id, str(user_id), amount)
+
+    def get_brackets(self, guild_id, user_id):
+        return self.bracket_roles.get(str(guild_id), {}).get(str(user_id), [])
+
+    def add_bracket(self, guild_id, user_id, emoji):
+        self._mutate('brkt_add', guild_id, str(user_id), emoji)
+
+    def remove_bracket(self, guild_id, user_id, emoji=None):
+        self._mutate('brkt_rmv', guild_id, str(user_id), emoji)
+
+    def restore_entry(self, guild_id, user_id, rp=None, crowns=None, brackets=None):
+        self.restore_entries(guild_id, [(user_id, rp, crowns, brackets)])
+
+    def _restore_changes(self, guild_str, user_str, rp, crowns, brackets):
+        """True if merging these parsed values would change the stored entry"""
+        if rp is not None and rp > self.rp_data.get(guild_str, {}).get(user_str, 0):
+            return True
+        if crowns is not None and crowns > self.crown_data.get(guild_str, {}).get(user_str, 0):
+            return True
+        user_brackets = self.bracket_roles.get(guild_str, {}).get(user_str, [])
+        return any(emoji not in user_brackets for emoji in brackets or ())
+
+    def restore_entries(self, guild_id, rows):
+        # One journal record for the whole leaderboard, unchanged rows left out
+        guild_str = str(guild_id)
+        changed = [[str(user_id), rp, crowns, list(brackets) if brackets else None]
+                   for user_id, rp, crowns, brackets in rows
+                   if self._restore_changes(guild_str, str(user_id), rp, crowns, brackets)]
+        if changed:
+            self._mutate('restore_batch', guild_id, changed)
+        return len(changed)
+
+    def apply_rewards(self, guild_id, changes):
+        # One journal record for the whole batch
+        changes = [[kind, str(user_id), value] for user_id, kind, value in changes]
+        for kind, _, _ in changes:
+            if kind not in self.REWARD_OPS:
+                raise ValueError(f"Unknown reward change {kind}")
+        if changes:
+            self._mutate('batch', guild_id, changes)
+
+    def reset_guild(self, guild_id):
+        self._mutate('reset', guild_id)
+
+    def has_scores(self, guild_id):
+        guild_str = str(guild_id)
+        return bool(self.rp_data.get(guild_str) or self.crown_data.get(guild_str))
+
+    def guild_entries(self, guild_id):
+        guild_str = str(guild_id)
+        guild_brackets = self.bracket_roles.get(guild_str, {})
+        return [(user_id, rp, crowns, guild_brackets.get(str(user_id), []))
+                for user_id, rp, crowns in self._ranking(guild_str).ordered()]
+
+    def top(self, guild_id, by='rp', limit=10, offset=0):
+        return self._ranking(str(guild_id)).top(by, limit, offset)
+
+    def rank(self, guild_id, user_id):
+        return self._ranking(str(guild_id)).rank(int(user_id))
+
+    def get_roles(self, guild_id, permission_type):
+        return self.role_permissions.get(str(guild_id), {}).get(permission_type, [])
+
+    def set_roles(self, guild_id, permission_type, role_ids):
+        # Journaled like every other mutation, so a backup fallback doesn't lose settings
+        self._mutate('roles', guild_id, permission_type, list(role_ids))
+
+    def get_log_channel(self, guild_id):
+        return self.log_channel_ids.get(str(guild_id))
+
+    def set_log_channel(self, guild_id, channel_id):
+        self._mutate('log_channel', guild_id, channel_id)
+
+    def log_channels(self):
+        return {int(g): c for g, c in self.log_channel_ids.items()}
+
+    def get_leaderboard_pages(self, guild_id):
+        return self.leaderboard_pages.get(str(guild_id), [])
+
+    def set_leaderboard_pages(self, guild_id, pages):
+        # Journaled: page digests change on every refresh
+        self._mutate('pages', guild_id, [list(page) for page in pages])
+
+    def save_tournament(self, guild_id, record):
+        self._mutate('tournament', guild_id, record)
+
+    def delete_tournament(self, guild_id):
+        if str(guild_id) in self.tournament_records:
+            self._mutate('tournament', guild_id, None)
+
+    def load_tournaments(self):
+        return {int(g): record for g, record in self.tournament_records.items()}
+
+
+class SqliteStorage(Storage):
+    """SQLite backend (WAL mode) keyed on (guild_id, user_id), nothing is kept in memory"""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS scores (
+        guild_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        rp INTEGER NOT NULL DEFAULT 0,
+        crowns INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (guild_id, user_id)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS scores_by_rp ON scores (guild_id, rp DESC, crowns DESC);
+    CREATE INDEX IF NOT EXISTS scores_by_crowns ON scores (guild_id, crowns DESC);
+    CREATE TABLE IF NOT EXISTS brackets (
+        guild_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        emojis TEXT NOT NULL,
+        PRIMARY KEY (guild_id, user_id)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS role_permissions (
+        guild_id INTEGER NOT NULL,
+        permission TEXT NOT NULL,
+        role_ids TEXT NOT NULL,
+        PRIMARY KEY (guild_id, permission)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS log_channels (
+        guild_id INTEGER PRIMARY KEY,
+        channel_id INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS leaderboard_pages (
+        guild_id INTEGER PRIMARY KEY,
+        pages TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS tournaments (
+        guild_id INTEGER PRIMARY KEY,
+        record TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    );
+    """
+
+    def __init__(self, db_path='user_data.db', **json_options):
+        self.path = db_path
+        self.json_path = json_options.get('path', 'user_data.json')
+        self.json_options = json_options
+        self.db = None
+
+    def load(self):
+        self.db = sqlite3.connect(self.path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(self.SCHEMA)
+        self.db.commit()
+        self._migrate_from_json()
+        print(f"✅ SQLite storage ready ({self.path})")
+
+    def _migrate_from_json(self):
+        """One-shot import of user_data.json (snapshot + journal) into an empty database"""
+        if self.db.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+            return
+        journal_path = self.json_options.get('journal_path', 'user_data.journal')
+        if os.path.exists(self.json_path) or os.path.exists(journal_path):
+            source = JsonStorage(**self.json_options)
+            source.load()
+            self.import_from(source)
+            source.journal.close()
+            print(f"✅ Migrated {self.json_path} into {self.path}")
+        self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('json_migrated', ?)",
+                        (str(int(time.time())),))
+        self.db.commit()
+
+    def import_from(self, source):
+        """Copy every row out of a loaded JsonStorage"""
+        with self.db:
+            for guild_str in set(source.rp_data) | set(source.crown_data):
+                guild_rp = source.rp_data.get(guild_str, {})
+                guild_crowns = source.crown_data.get(guild_str, {})
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO scores (guild_id, user_id, rp, crowns) VALUES (?, ?, ?, ?)",
+                    [(int(guild_str), int(u), guild_rp.get(u, 0), guild_crowns.get(u, 0))
+                     for u in set(guild_rp) | set(guild_crowns)])
+            for guild_str, users in source.bracket_roles.items():
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO brackets (guild_id, user_id, emojis) VALUES (?, ?, ?)",
+                    [(int(guild_str), int(u), json.dumps(e)) for u, e in users.items() if e])
+            for guild_str, perms in source.role_permissions.items():
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO role_permissions (guild_id, permission, role_ids) VALUES (?, ?, ?)",
+                    [(int(guild_str), p, json.dumps(r)) for p, r in perms.items()])
+            self.db.executemany(
+                "INSERT OR REPLACE INTO log_channels (guild_id, channel_id) VALUES (?, ?)",
+                [(int(g), c) for g, c in source.log_channel_ids.items()])
+            self.db.executemany(
+                "INSERT OR REPLACE INTO leaderboard_pages (guild_id, pages) VALUES (?, ?)",
+                [(int(g), json.dumps(p)) for g, p in source.leaderboard_pages.items()])
+            self.db.executemany(
+                "INSERT OR REPLACE INTO tournaments (guild_id, record) VALUES (?, ?)",
+                [(int(g), json.dumps(r)) for g, r in source.tournament_records.items()])
+
+    async def flush(self):
+        self.db.commit()
+
+    def close(self):
+        if self.db is not None:
+            self.db.commit()
+            self.db.close()
+            self.db = None
+
+    def last_save(self):
+        # Commits land in the WAL file until a checkpoint moves them into the database
+        times = [os.path.getmtime(p) for p in (self.path + '-wal', self.path) if os.path.exists(p)]
+        return max(times) if times else None
+
+    def _score(self, column, guild_id, user_id):
+        row = self.db.execute(
+            f"SELECT {column} FROM scores WHERE guild_id = ? AND user_id = ?",
+            (int(guild_id), int(user_id))).fetchone()
+        return row[0] if row else 0
+
+    def get_rp(self, guild_id, user_id):
+        return self._score('rp', guild_id, user_id)
+
+    def get_crowns(self, guild_id, user_id):
+        return self._score('crowns', guild_id, user_id)
+
+    def _bump_score(self, column, guild_id, user_id, amount):
+        self.db.execute(
+            f"INSERT INTO scores (guild_id, user_id, {column}) VALUES (?, ?, ?) "
+            f"ON CONFLICT (guild_id, user_id) DO UPDATE SET {column} = {column} + excluded.{column}",
+            (int(guild_id), int(user_id), amount))
+
+    def _add_score(self, column, guild_id, user_id, amount):
+        with self.db:
+            self._bump_score(column, guild_id, user_id, amount)
+
+    def add_rp(self, guild_id, user_id, amount):
+        self._add_score('rp', guild_id, user_id, amount)
+
+    def add_crowns(self, guild_id, user_id, amount):
+        self._add_score('crowns', guild_id, user_id, amount)
+
+    def get_brackets(self, guild_id, user_id):
+        row = self.db.execute(
+            "SELECT emojis FROM brackets WHERE guild_id = ? AND user_id = ?",
+            (int(guild_id), int(user_id))).fetchone()
+        return json.loads(row[0]) if row else []
+
+    def _set_brackets(self, guild_id, user_id, emojis):
+        if emojis:
+            self.db.execute(
+                "INSERT OR REPLACE INTO brackets (guild_id, user_id, emojis) VALUES (?, ?, ?)",
+                (int(guild_id), int(user_id), json.dumps(emojis)))
+        else:
+            self.db.execute("DELETE FROM brackets WHERE guild_id = ? AND user_id = ?",
+                            (int(guild_id), int(user_id)))
+
+    def _add_bracket(self, guild_id, user_id, emoji):
+        emojis = self.get_brackets(guild_id, user_id)
+        if emoji not in emojis:
+            self._set_brackets(guild_id, user_id, emojis + [emoji])
+
+    def _remove_bracket(self, guild_id, user_id, emoji):
+        emojis = self.get_brackets(guild_id, user_id)
+        if emoji is not None and emoji in emojis:
+            emojis.remove(emoji)
+        elif emoji is None:
+            emojis = []
+        self._set_brackets(guild_id, user_id, emojis)
+
+    def add_bracket(self, guild_id, user_id, emoji):
+        with self.db:
+            self._add_bracket(guild_id, user_id, emoji)
+
+    def remove_bracket(self, guild_id, user_id, emoji=None):
+        with self.db:
+            self._remove_bracket(guild_id, user_id, emoji)
+
+    def restore_entry(self, guild_id, user_id, rp=None, crowns=None, brackets=None):
+        self.restore_entries(guild_id, [(user_id, rp, crowns, brackets)])
+
+    def restore_entries(self, guild_id, rows):
+        # One transaction, the WHERE leaves rows without a higher value untouched
+        merged = 0
+        with self.db:
+            for user_id, rp, crowns, brackets in rows:
+                cursor = self.db.execute(
+                    "INSERT INTO scores (guild_id, user_id, rp, crowns) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (guild_id, user_id) DO UPDATE SET "
+                    "rp = MAX(rp, excluded.rp), crowns = MAX(crowns, excluded.crowns) "
+                    "WHERE excluded.rp > rp OR excluded.crowns > crowns",
+                    (int(guild_id), int(user_id), rp or 0, crowns or 0))
+                changed = cursor.rowcount > 0
+                if brackets:
+                    emojis = self.get_brackets(guild_id, user_id)
+                    missing = [e for e in brackets if e not in emojis]
+                    if missing:
+                        self._set_brackets(guild_id, user_id, emojis + missing)
+                        changed = True
+                merged += changed
+        return merged
+
+    def apply_rewards(self, guild_id, changes):
+        # One transaction, one commit
+        with self.db:
+            for user_id, kind, value in changes:
+                if kind == 'rp':
+                    self._bump_score('rp', guild_id, user_id, value)
+                elif kind == 'crown':
+                    self._bump_score('crowns', guild_id, user_id, value)
+                elif kind == 'brkt_add':
+                    self._add_bracket(guild_id, user_id, value)
+                elif kind == 'brkt_rmv':
+                    self._remove_bracket(guild_id, user_id, value)
+                else:
+                    raise ValueError(f"Unknown reward change {kind}")
+
+    def reset_guild(self, guild_id):
+        with self.db:
+            self.db.execute("DELETE FROM scores WHERE guild_id = ?", (int(guild_id),))
+            self.db.execute("DELETE FROM brackets WHERE guild_id = ?", (int(guild_id),))
+
+    def has_scores(self, guild_id):
+        return self.db.execute("SELECT 1 FROM scores WHERE guild_id = ? LIMIT 1",
+                               (int(guild_id),)).fetchone() is not None
+
+    def guild_entries(self, guild_id):
+        rows = self.db.execute(
+            "SELECT s.user_id, s.rp, s.crowns, b.emojis FROM scores s "
+            "LEFT JOIN brackets b ON b.guild_id = s.guild_id AND b.user_id = s.user_id "
+            "WHERE s.guild_id = ? "
+            "UNION ALL "
+            "SELECT b.user_id, 0, 0, b.emojis FROM brackets b "
+            "WHERE b.guild_id = ? AND NOT EXISTS "
+            "(SELECT 1 FROM scores s WHERE s.guild_id = b.guild_id AND s.user_id = b.user_id) "
+            "ORDER BY 2 DESC, 3 DESC, 1",
+            (int(guild_id), int(guild_id)))
+
+        entries = []
+        for user_id, rp, crowns, emojis in rows:
+            brackets = json.loads(emojis) if emojis else []
+            if rp > 0 or crowns > 0 or brackets:
+                entries.append((user_id, rp, crowns, brackets))
+        return entries
+
+    def top(self, guild_id, by='rp', limit=10, offset=0):
+        if by == 'crowns':
+            query = ("SELECT user_id, rp, crowns FROM scores WHERE guild_id = ? AND crowns > 0 "
+                     "ORDER BY crowns DESC, user_id LIMIT ? OFFSET ?")
+        else:
+            query = ("SELECT user_id, rp, crowns FROM scores WHERE guild_id = ? "
+                     "AND (rp > 0 OR crowns > 0) ORDER BY rp DESC, crowns DESC, user_id LIMIT ? OFFSET ?")
+        return self.db.execute(query, (int(guild_id), limit, offset)).fetchall()
+
+    def rank(self, guild_id, user_id):
+        row = self.db.execute(
+            "SELECT rp, crowns FROM scores WHERE guild_id = ? AND user_id = ? AND (rp > 0 OR crowns > 0)",
+            (int(guild_id), int(user_id))).fetchone()
+        if row is None:
+            return None
+        rp, crowns = row
+        ahead, total = self.db.execute(
+            "SELECT SUM(rp > ? OR (rp = ? AND (crowns > ? OR (crowns = ? AND user_id < ?)))), COUNT(*) "
+            "FROM scores WHERE guild_id = ? AND (rp > 0 OR crowns > 0)",
+            (rp, rp, crowns, crowns, int(user_id), int(guild_id))).fetchone()
+        return ahead + 1, total
+
+    def get_roles(self, guild_id, permission_type):
+        row = self.db.execute(
+            "SELECT role_ids FROM role_permissions WHERE guild_id = ? AND permission = ?",
+            (int(guild_id), permission_type)).fetchone()
+        return json.loads(row[0]) if row else []
+
+    def set_roles(self, guild_id, permission_type, role_ids):
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO role_permissions (guild_id, permission, role_ids) VALUES (?, ?, ?)",
+                (int(guild_id), permission_type, json.dumps(list(role_ids))))
+
+    def get_log_channel(self, guild_id):
+        row = self.db.execute("SELECT channel_id FROM log_channels WHERE guild_id = ?",
+                              (int(guild_id),)).fetchone()
+        return row[0] if row else None
+
+    def set_log_channel(self, guild_id, channel_id):
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO log_channels (guild_id, channel_id) VALUES (?, ?)",
+                            (int(guild_id), channel_id))
+
+    def log_channels(self):
+        return dict(self.db.execute("SELECT guild_id, channel_id FROM log_channels"))
+
+    def get_leaderboard_pages(self, guild_id):
+        row = self.db.execute("SELECT pages FROM leaderboard_pages WHERE guild_id = ?",
+                              (int(guild_id),)).fetchone()
+        return json.loads(row[0]) if row else []
+
+    def set_leaderboard_pages(self, guild_id, pages):
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO leaderboard_pages (guild_id, pages) VALUES (?, ?)",
+                            (int(guild_id), json.dumps([list(page) for page in pages])))
+
+    def save_tournament(self, guild_id, record):
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO tournaments (guild_id, record) VALUES (?, ?)",
+                            (int(guild_id), json.dumps(record, separators=(',', ':'))))
+
+    def delete_tournament(self, guild_id):
+        with self.db:
+            self.db.execute("DELETE FROM tournaments WHERE guild_id = ?", (int(guild_id),))
+
+    def load_tournaments(self):
+        return {guild_id: json.loads(record) for guild_id, record
+                in self.db.execute("SELECT guild_id, record FROM tournaments")}
+
+
+def create_storage(backend='json', sqlite_path='user_data.db', **json_options):
+    """Build the storage backend selected by name"""
+    if backend == 'sqlite':
+        return SqliteStorage(sqlite_path, **json_options)
+    if backend == 'json':
+        return JsonStorage(**json_options)
+    raise ValueError(f"Unknown storage backend {backend}")